@@ -1,19 +1,38 @@
+import gc
 import logging
 import numpy
-import operator
-import random
 
+from ars_state import ARSState
+from eligibilities import Eligibilities
 from file_manager import open_file
 from identity import Identity
+from identity import generate_identities
 from logger import create_logger
 
+# Names and reputations of the identities in an ARS file
+def read_ars_file(ars_file):
+    f = open_file(ars_file)
+    identity_lines = [line.split(",") for line in f]
+    f.close()
+    names = [identity_line[0] for identity_line in identity_lines]
+    reputations = numpy.array([int(identity_line[1]) for identity_line in identity_lines], dtype=numpy.int64)
+    return names, reputations
+
 class ARS:
-    def __init__(self, log_stdout, log_file, collateral_locked):
-        self.logger = create_logger("ARS", log_stdout, log_file)
-        self.identity_logger = create_logger("identity", log_stdout, log_file)
+    def __init__(self, log_stdout, log_file, collateral_locked, log_path="simulation.log", seed=None):
+        self.logger = create_logger("ARS", log_stdout, log_file, log_path)
+        self.identity_logger = create_logger("identity", log_stdout, log_file, log_path)
 
         self.current_reputation = 0
 
+        # Data requests that could not be solved since the statistics were last cleared
+        self.unsolved_data_requests = 0
+
+        # Cumulative counters over all commit rounds of all data requests, only their differences are meaningful
+        self.commit_rounds_used = 0
+        self.eligible_identities = 0
+        self.insufficient_collateral_identities = 0
+
         # Set consensus constants
         self.total_reputation = 1 << 20
         self.reputation_expire = 20000
@@ -22,107 +41,161 @@ class ARS:
         # Configurable consensus constants
         self.collateral_locked = collateral_locked
 
+        # Independent random number generators per component, derived from one seed so a simulation is reproducible
+        seed_sequence = seed if isinstance(seed, numpy.random.SeedSequence) else numpy.random.SeedSequence(seed)
+        eligibility_seed, selection_seed, init_seed, names_seed = seed_sequence.spawn(4)
+        # Draw eligibilities
+        self.rng = numpy.random.default_rng(eligibility_seed)
+        # Choose witnesses among the eligible identities
+        self.selection_rng = numpy.random.default_rng(selection_seed)
+        # Distribute reputation and collateral when initializing the ARS
+        self.init_rng = numpy.random.default_rng(init_seed)
+        # Generate identity names
+        self.names_rng = numpy.random.default_rng(names_seed)
+
+        # Key of the common random numbers shared by all simulations of a comparison, disabled if None
+        self.common_random_numbers = None
+
+        # ARS size from which eligible identities are drawn per group of ranks instead of per identity
+        self.sparse_eligibility_identities = 20000
+
+        # Eligibilities of the last block and the (active identities, active reputation, minimum reputation, identities)
+        # parameters of the trapezoid they were calculated with
+        self.eligibilities = None
+        self.eligibility_parameters = None
+
     def initialize_zero_reputation_ARS(self, identities, balance):
-        # Identities
-        self.identities = {}
-        self.number_of_identities = identities
-        for reputation in range(self.number_of_identities):
-            identity = Identity(
-                logger=self.identity_logger,
-                available_collateral=[(0, balance)],
-            )
-            self.identities[identity.name] = identity
+        # Every identity starts without reputation and with its balance as one UTXO
+        self.create_identities(
+            generate_identities(self.names_rng, identities),
+            numpy.zeros(identities, dtype=numpy.int64),
+            *self.empty_items(identities),
+            numpy.ones(identities, dtype=numpy.int64),
+            numpy.zeros(identities, dtype=numpy.int64),
+            numpy.full(identities, balance, dtype=numpy.int64),
+        )
 
         self.current_witnessing_acts = 0
 
     def initialize_ARS_from_file(self, ars_file, balance):
-        f = open_file(ars_file)
-        identity_lines = [(line.split(",")[0], int(line.split(",")[1])) for line in f]
-        f.close()
-
-        # Identities
-        self.identities = {}
-        self.number_of_identities = len(identity_lines)
-        for name, reputation in identity_lines:
-            # Each identity gained reputation from witnessing acts at random times (filtering out zero values)
-            random_reputation_gain = self.generate_random_list(int(reputation / 10) + 1, reputation, True)
-            identity = Identity(
-                logger=self.identity_logger,
-                name=name,
-                total_reputation=reputation,
-                reputation_gains=sorted([
-                    (random.randint(0, self.reputation_expire), random_reputation_gain[i]) for i in range(len(random_reputation_gain))
-                ]),
-                available_collateral=[(0, balance)],
-            )
-            self.identities[identity.name] = identity
+        self.initialize_ARS_from_reputations(*read_ars_file(ars_file), balance)
+
+    # Create the identities of an ARS file from their names and reputations, read by this or another process
+    def initialize_ARS_from_reputations(self, names, reputations, balance):
+        # Each identity gained reputation from witnessing acts at random times (filtering out zero values)
+        gains, gain_counts = self.split_randomly(reputations, reputations // 10 + 1, True)
+        gain_times, gains = self.random_timeline(gains, gain_counts, self.reputation_expire)
+
+        self.create_identities(
+            names,
+            reputations,
+            gain_counts,
+            gain_times,
+            gains,
+            numpy.ones(len(names), dtype=numpy.int64),
+            numpy.zeros(len(names), dtype=numpy.int64),
+            numpy.full(len(names), balance, dtype=numpy.int64),
+        )
 
         self.current_witnessing_acts = 0
 
     def initialize_random_ARS(self, identities, max_reputation, zero_reputation_ratio, balance):
-        self.number_of_identities = identities
-
-        # Assign random reputations to part of the ARS
-        self.all_reputation = random.sample(range(1, max_reputation), int(self.number_of_identities * (1 - zero_reputation_ratio / 100)))
-        # Assign some 0 reputation identities according to a predefined ratio
-        self.all_reputation.extend([0] * (self.number_of_identities - len(self.all_reputation)))
+        # Assign random reputations to part of the ARS, the other identities have zero reputation according to a predefined ratio
+        reputations = numpy.zeros(identities, dtype=numpy.int64)
+        active = int(identities * (1 - zero_reputation_ratio / 100))
+        reputations[:active] = self.init_rng.choice(numpy.arange(1, max_reputation), active, replace=False)
         # Make sure the sum of all reputations is equal to self.total_reputation
-        self.all_reputation = [int(reputation / sum(self.all_reputation) * self.total_reputation) for reputation in self.all_reputation]
-        for i in range(0, self.total_reputation - sum(self.all_reputation)):
-            self.all_reputation[i] += 1
-
-        for reputation in self.all_reputation:
-            # Each identity gained reputation from witnessing acts at random times (filtering out zero values)
-            random_reputation_gain = self.generate_random_list(int(reputation / 16) + 1, reputation, True)
-            # Each identity has UTXO's that are locked until a random time (filtering out zero values)
-            random_utxos = self.generate_random_list(int(reputation / 16) + 1, balance, True)
-            # Each identity gained a random amount of reputation
-            identity = Identity(
-                logger=self.identity_logger,
-                total_reputation=reputation,
-                reputation_gains=sorted([
-                    (random.randint(0, self.reputation_expire), random_reputation_gain[i]) for i in range(len(random_reputation_gain))
-                ]),
-                available_collateral=sorted([
-                    (random.randint(0, self.collateral_locked), random_utxos[i]) for i in range(len(random_utxos))
-                ]),
-            )
-
-            self.logger.debug(f"Created identity: {identity}")
-
-            self.identities[identity.name] = identity
+        reputations = (reputations / reputations.sum() * self.total_reputation).astype(numpy.int64)
+        reputations[:self.total_reputation - int(reputations.sum())] += 1
+
+        # Each identity gained reputation from witnessing acts at random times (filtering out zero values)
+        gains, gain_counts = self.split_randomly(reputations, reputations // 16 + 1, True)
+        gain_times, gains = self.random_timeline(gains, gain_counts, self.reputation_expire)
+        # Each identity has UTXO's that are locked until a random time (filtering out zero values)
+        utxos, utxo_counts = self.split_randomly(numpy.full(identities, balance, dtype=numpy.int64), reputations // 16 + 1, True)
+        utxo_epochs, utxos = self.random_timeline(utxos, utxo_counts, self.collateral_locked)
+
+        self.create_identities(generate_identities(self.names_rng, identities), reputations, gain_counts, gain_times, gains, utxo_counts, utxo_epochs, utxos)
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for identity in self.identities.values():
+                self.logger.debug("Created identity: %s", identity)
 
         # Set current witnessing acts such that a random amount of reputation can expire on the first new data request
         self.current_witnessing_acts = int(self.reputation_expire * 1.1)
 
-    def generate_random_list(self, items, total_sum, filter_zeros):
-        random_list = [random.random() for i in range(items)]
-        random_list = [int(random_list[i] / sum(random_list) * total_sum) for i in range(items)]
-        for i in range(0, total_sum - sum(random_list)):
-            random_list[i] += 1
-        random_list = list(filter(lambda x: x != 0, random_list))
-        assert sum(random_list) == total_sum
-        return random_list
+    # Create all identities at once from their names and reputations, their (witnessing acts, reputation) gains and
+    # (collaterizable epoch, amount) UTXOs are given as the items of all identities concatenated, in chronological order
+    # per identity, together with the number of items of every identity
+    def create_identities(self, names, reputations, gain_counts, gain_times, gains, utxo_counts=None, utxo_epochs=None, utxos=None):
+        self.identities = {}
+        self.number_of_identities = len(names)
+        self.state = ARSState(self.number_of_identities)
+
+        # Identities never form reference cycles, so the garbage collector is paused instead of repeatedly scanning
+        # the objects created for a large ARS
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self.state.add_identities(names, reputations)
+            for index, name in enumerate(self.state.names):
+                self.identities[name] = Identity(self.state, index, logger=self.identity_logger)
+            assert len(self.identities) == len(names), "Duplicate identities"
+
+            self.state.gain_reputations(gain_counts, gain_times, gains)
+            if utxo_counts is not None:
+                self.state.lock_collaterals(utxo_counts, utxo_epochs, utxos)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    # Counts and items of identities without any items
+    def empty_items(self, identities):
+        return numpy.zeros(identities, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+
+    # Split every total into its number of random integer parts which sum exactly to it, in time linear in the number of parts
+    # Parts are rounded down and the remainder is handed out one by one to the first parts of the total
+    # Returns the parts of all totals concatenated and the number of parts per total, zero parts are dropped if filter_zeros
+    def split_randomly(self, totals, counts, filter_zeros):
+        assert (counts > 0).all()
+        owners = numpy.repeat(numpy.arange(len(totals)), counts)
+        starts = numpy.cumsum(counts) - counts
+
+        weights = self.init_rng.random(int(counts.sum()))
+        parts = (weights / numpy.add.reduceat(weights, starts)[owners] * totals[owners]).astype(numpy.int64)
+        remainders = totals - numpy.add.reduceat(parts, starts)
+        assert ((remainders >= 0) & (remainders <= counts)).all()
+        parts += numpy.arange(len(parts)) - starts[owners] < remainders[owners]
+
+        if filter_zeros:
+            nonzero = parts != 0
+            parts, counts = parts[nonzero], numpy.bincount(owners[nonzero], minlength=len(totals))
+        assert (numpy.bincount(numpy.repeat(numpy.arange(len(totals)), counts), weights=parts, minlength=len(totals)) == totals).all()
+
+        return parts, counts
+
+    # Draw a random time in [0, high] for every part and order the (time, part) items of every identity chronologically
+    def random_timeline(self, parts, counts, high):
+        owners = numpy.repeat(numpy.arange(len(counts)), counts)
+        times = self.init_rng.integers(0, high, size=len(parts), endpoint=True)
+        order = numpy.lexsort((parts, times, owners))
+        return times[order], parts[order]
 
     def set_reputations(self, reputations):
         assert len(self.identities) == len(reputations)
-        for identity, reputation in zip(self.identities.keys(), reputations):
-            self.identities[identity].reputation = reputation
+        self.state.total_reputation[:] = reputations
+        self.state.invalidate_ranking()
 
-    # Calculate the result of `y = mx + K`
+    # Calculate the result of `y = mx + K` for all x
     # The result is rounded and low saturated in 0
     def magic_line(self, x, m, k):
-        res = m * x + k
-        if res < 0:
-            return 0
-        else:
-            return round(res, 0)
+        return numpy.round(numpy.maximum(m * x + k, 0), 0)
 
-    # List only those identities with reputation greater than zero
+    # List the indices of only those identities with reputation greater than zero, ordered by reputation
     def filter_reputed_identities(self):
-        non_zero_reputation_identities = sorted([identity for identity in self.identities.values() if identity.total_reputation > 0], key=operator.attrgetter("total_reputation"), reverse=True)
-        total_reputation = sum([identity.total_reputation for identity in self.identities.values()])
-        return non_zero_reputation_identities, total_reputation
+        self.state.update_ranking()
+        non_zero_reputation_identities = numpy.array([index for _, index in self.state.ranking[:self.state.active_identities]], dtype=numpy.int64)
+        return non_zero_reputation_identities, self.state.active_reputation
 
     # Calculate the values and the total reputation
     # for the upper triangle of the trapezoid
@@ -134,85 +207,256 @@ class ARS:
         # m: negative slope with -k
         m = -k / (active_reputed_ids_len - 1)
 
-        triangle_reputation = []
-        total_triangle_reputation = 0
-        for i in range(0, active_reputed_ids_len):
-            calculated_rep = self.magic_line(i, m, k)
-            triangle_reputation.append(calculated_rep)
-            total_triangle_reputation += calculated_rep
+        triangle_reputation = self.magic_line(numpy.arange(active_reputed_ids_len), m, k)
+        total_triangle_reputation = triangle_reputation.sum()
 
         return triangle_reputation, total_triangle_reputation
 
+    # Use the trapezoid distribution to calculate the eligibility of each rank in the reputation ranking
+    # The trapezoid only depends on the number of active identities, their total and their minimum reputation
+    def calculate_trapezoid(self, total_active_rep, active_reputed_ids_len, minimum_rep):
+        # Calculate upper triangle reputation in the trapezoidal eligibility
+        triangle_reputation, total_triangle_reputation = self.calculate_trapezoid_triangle(total_active_rep, active_reputed_ids_len, minimum_rep)
+
+        # To complete the trapezoid, an offset needs to be added (the rectangle at the base)
+        remaining_reputation = total_active_rep - total_triangle_reputation
+        offset_reputation = remaining_reputation / active_reputed_ids_len
+        ids_with_extra_rep = remaining_reputation % active_reputed_ids_len
+
+        trapezoid_rep = triangle_reputation + offset_reputation
+        trapezoid_rep[numpy.arange(active_reputed_ids_len) < ids_with_extra_rep] += 1
+
+        return trapezoid_rep.astype(numpy.int64)
+
     # Use the trapezoid distribution to calculate eligibility for each of the identities
     # in the ARS based on their reputation ranking
-    def trapezoidal_eligibility(self):
+    # Returns the identity indices ordered by reputation and the eligibility of each of them
+    def trapezoidal_eligibility_by_rank(self):
         active_reputed_ids, total_active_rep = self.filter_reputed_identities()
 
         if len(active_reputed_ids) == 0:
-            return {}, 0
+            return active_reputed_ids, numpy.zeros(0, dtype=numpy.int64), 0
 
-        # Calculate upper triangle reputation in the trapezoidal eligibility
-        minimum_rep = active_reputed_ids[-1].total_reputation
-        triangle_reputation, total_triangle_reputation = self.calculate_trapezoid_triangle(total_active_rep, len(active_reputed_ids), minimum_rep)
+        minimum_rep = int(self.state.total_reputation[active_reputed_ids[-1]])
+        trapezoid_rep = self.calculate_trapezoid(total_active_rep, len(active_reputed_ids), minimum_rep)
 
-        # To complete the trapezoid, an offset needs to be added (the rectangle at the base)
-        remaining_reputation = total_active_rep - total_triangle_reputation
-        offset_reputation = remaining_reputation / len(active_reputed_ids)
-        ids_with_extra_rep = remaining_reputation % len(active_reputed_ids)
+        return active_reputed_ids, trapezoid_rep, total_active_rep
+
+    def trapezoidal_eligibility(self):
+        active_reputed_ids, trapezoid_rep, total_active_rep = self.trapezoidal_eligibility_by_rank()
 
         eligibility = {}
-        for i, (ar_id, rep) in enumerate(zip(active_reputed_ids, triangle_reputation)):
-            trapezoid_rep = rep + offset_reputation
-            if i < ids_with_extra_rep:
-                trapezoid_rep += 1
-            eligibility[ar_id.name] = int(trapezoid_rep)
+        for index, rep in zip(active_reputed_ids, trapezoid_rep):
+            eligibility[self.state.names[index]] = int(rep)
 
         return eligibility, total_active_rep
 
     # Calculate actual relative eligibilities adding 1 to each of the identities
+    # Only the identities whose reputation changed are moved in the ranking and the trapezoid is only
+    # recalculated if its parameters changed, otherwise the eligibilities of the last block are reused
     def calculate_eligibilities(self):
-        eligibility, total_active_rep = self.trapezoidal_eligibility()
+        ranking_changed = self.state.update_ranking()
+
+        active_reputed_ids_len, total_active_rep = self.state.active_identities, self.state.active_reputation
+        minimum_rep = -self.state.ranking[active_reputed_ids_len - 1][0] if active_reputed_ids_len > 0 else 0
+        eligibility_parameters = (active_reputed_ids_len, total_active_rep, minimum_rep, len(self.state))
+        if self.eligibilities is not None and self.eligibilities.ranking is self.state.ranking and eligibility_parameters == self.eligibility_parameters:
+            # The probabilities per rank still hold, but identities may have moved to other ranks
+            if ranking_changed:
+                self.eligibilities.identity_indices = None
+            return self.eligibilities
+
+        probabilities = numpy.ones(len(self.state), dtype=float)
+        if active_reputed_ids_len > 0:
+            probabilities[:active_reputed_ids_len] += self.calculate_trapezoid(total_active_rep, active_reputed_ids_len, minimum_rep)
+        probabilities /= total_active_rep + len(self.state)
+
+        self.eligibilities = Eligibilities(self.state.ranking, probabilities)
+        self.eligibility_parameters = eligibility_parameters
+
+        return self.eligibilities
+
+    # Calculate the probability for each identity to be eligible in a commit round
+    def eligibility_probabilities(self, eligibilities, approximate_eligibility, num_witnesses, commit_round):
+        draws = num_witnesses * (2 ** commit_round)
+        if approximate_eligibility:
+            # Linear approximation of the exact probability
+            return eligibilities * draws
+        else:
+            # An identity is eligible if the minimum of `draws` uniform values is lower than its eligibility,
+            # which happens with probability 1 - (1 - eligibility) ^ draws
+            return -numpy.expm1(draws * numpy.log1p(-eligibilities))
+
+    # Eligibility probabilities of a commit round, calculated once per set of eligibilities
+    # Probabilities are per rank or, with groups set, per group of ranks sharing the same eligibility
+    def round_probabilities(self, eligibilities, approximate_eligibility, num_witnesses, commit_round, groups=False):
+        round_key = (groups, approximate_eligibility, num_witnesses, commit_round)
+        if round_key not in eligibilities.round_probabilities:
+            probabilities = eligibilities.probabilities[eligibilities.groups()[0]] if groups else eligibilities.probabilities
+            probabilities = self.eligibility_probabilities(probabilities, approximate_eligibility, num_witnesses, commit_round)
+            eligibilities.round_probabilities[round_key] = numpy.minimum(probabilities, 1)
+        return eligibilities.round_probabilities[round_key]
+
+    # Draw the ranks of the identities eligible in a commit round
+    # One uniform draw per identity is cheaper for small ARS, larger ARS draw eligible identities per group of ranks
+    def draw_eligible_ranks(self, eligibilities, approximate_eligibility, num_witnesses, commit_round):
+        if len(eligibilities) < self.sparse_eligibility_identities:
+            return self.draw_eligible_ranks_dense(eligibilities, approximate_eligibility, num_witnesses, commit_round)
+        else:
+            return self.draw_eligible_ranks_sparse(eligibilities, approximate_eligibility, num_witnesses, commit_round)
+
+    # Draw the ranks of the identities eligible in a commit round
+    # Eligible identities are drawn per group of ranks sharing the same eligibility: first a binomial draw for how many
+    # identities in the group are eligible and then a uniform sample of which ones, so the cost scales with the number of
+    # groups and eligible identities rather than with the size of the ARS
+    def draw_eligible_ranks_sparse(self, eligibilities, approximate_eligibility, num_witnesses, commit_round):
+        group_starts, group_sizes = eligibilities.groups()
+        probabilities = self.round_probabilities(eligibilities, approximate_eligibility, num_witnesses, commit_round, groups=True)
+        eligible_ranks, groups = self.sample_ranks(group_starts, group_sizes, self.rng.binomial(group_sizes, probabilities))
+        return eligible_ranks.tolist()
+
+    # Draw the ranks of the identities eligible in a commit round using one uniform draw per identity
+    def draw_eligible_ranks_dense(self, eligibilities, approximate_eligibility, num_witnesses, commit_round):
+        probabilities = self.round_probabilities(eligibilities, approximate_eligibility, num_witnesses, commit_round)
+        return numpy.flatnonzero(self.rng.random(len(eligibilities)) < probabilities).tolist()
+
+    # Common random numbers for one commit round of a data request: one uniform per identity to draw its eligibility and one
+    # to prioritize it when choosing witnesses
+    # The uniforms are keyed by the epoch, data request and commit round and indexed by identity, so every simulation
+    # with the same seed sees the same numbers for the same identity, however its reputation ranking evolved
+    def common_uniforms(self, epoch, data_request, commit_round):
+        rng = numpy.random.default_rng([*self.common_random_numbers, epoch, data_request, commit_round])
+        return rng.random((2, len(self.state)))
+
+    def draw_common_eligible_ranks(self, eligibilities, approximate_eligibility, num_witnesses, commit_round, uniforms):
+        probabilities = self.round_probabilities(eligibilities, approximate_eligibility, num_witnesses, commit_round)
+        return numpy.flatnonzero(uniforms[eligibilities.identities()] < probabilities).tolist()
+
+    # Uniformly sample counts[i] distinct ranks out of the run of sizes[i] ranks starting at starts[i]
+    # Returns the sampled ranks and the index of the run each of them was sampled from
+    def sample_ranks(self, starts, sizes, counts):
+        runs = numpy.flatnonzero(counts)
+
+        # Sample ranks with replacement in all runs at once, duplicates are rare in the large runs
+        run_of_rank = numpy.repeat(runs, counts[runs])
+        ranks = starts[run_of_rank] + self.rng.integers(0, sizes[run_of_rank])
+
+        # Resample runs which drew the same rank twice without replacement
+        order = numpy.lexsort((ranks, run_of_rank))
+        sorted_runs, sorted_ranks = run_of_rank[order], ranks[order]
+        duplicate = (sorted_runs[1:] == sorted_runs[:-1]) & (sorted_ranks[1:] == sorted_ranks[:-1])
+        if numpy.any(duplicate):
+            duplicate_runs = numpy.unique(sorted_runs[1:][duplicate])
+            keep = ~numpy.isin(run_of_rank, duplicate_runs)
+            ranks, run_of_rank = [ranks[keep]], [run_of_rank[keep]]
+            for run in duplicate_runs.tolist():
+                ranks.append(starts[run] + self.rng.choice(sizes[run], counts[run], replace=False))
+                run_of_rank.append(numpy.full(counts[run], run))
+            ranks, run_of_rank = numpy.concatenate(ranks), numpy.concatenate(run_of_rank)
+
+        return ranks, run_of_rank
+
+    # Draw the ranks of the identities eligible in the first commit round for all data requests of a block at once
+    # Returns a list with the eligible ranks of every data request
+    def draw_first_round_eligible_ranks(self, eligibilities, approximate_eligibility, data_requests):
+        num_witnesses = [witnesses for witnesses, collateral in data_requests]
+        if len(eligibilities) < self.sparse_eligibility_identities:
+            # One matrix of uniform draws for all data requests and identities
+            probabilities = numpy.stack([self.round_probabilities(eligibilities, approximate_eligibility, witnesses, 0) for witnesses in num_witnesses])
+            data_request_of_rank, eligible_ranks = numpy.nonzero(self.rng.random(probabilities.shape) < probabilities)
+        else:
+            # One matrix of binomial draws for all data requests and groups of ranks
+            group_starts, group_sizes = eligibilities.groups()
+            probabilities = numpy.stack([self.round_probabilities(eligibilities, approximate_eligibility, witnesses, 0, groups=True) for witnesses in num_witnesses])
+            starts, sizes = numpy.tile(group_starts, len(data_requests)), numpy.tile(group_sizes, len(data_requests))
+            eligible_ranks, runs = self.sample_ranks(starts, sizes, self.rng.binomial(sizes, probabilities.ravel()))
+            data_request_of_rank = runs // len(group_starts)
+
+        # Split the eligible ranks per data request
+        order = numpy.argsort(data_request_of_rank, kind="stable")
+        boundaries = numpy.searchsorted(data_request_of_rank[order], numpy.arange(1, len(data_requests)))
+        return [ranks.tolist() for ranks in numpy.split(eligible_ranks[order], boundaries)]
+
+    # Select witnesses for all data requests of a block
+    # Eligibility for the first commit round is drawn for all data requests at once, collateral is then used in data
+    # request order and later commit rounds are only drawn for data requests that need them
+    def select_witnesses_batch(self, eligibilities, approximate_eligibility, data_requests, epoch):
+        if len(data_requests) == 0:
+            return []
+
+        self.state.unlock_collateral(epoch)
+
+        # Common random numbers are drawn per data request
+        if self.common_random_numbers is not None:
+            first_round_eligible_ranks = [None] * len(data_requests)
+        else:
+            first_round_eligible_ranks = self.draw_first_round_eligible_ranks(eligibilities, approximate_eligibility, data_requests)
 
-        eligibilities = {}
-        for identity in self.identities.keys():
-            eligibilities[identity] = (eligibility.get(identity, 0) + 1) / (total_active_rep + len(self.identities))
+        results = []
+        for data_request, ((witnesses, collateral), eligible_ranks) in enumerate(zip(data_requests, first_round_eligible_ranks)):
+            results.append(self.select_witnesses(eligibilities, approximate_eligibility, witnesses, epoch, collateral, first_round_eligible_ranks=eligible_ranks, data_request=data_request))
+        return results
 
-        return eligibilities
+    # Returns whether the data request was solved and the indices of the eligible and insufficient collateral identities
+    # The eligible ranks of the first commit round can be drawn beforehand
+    # The index of the data request in its block keys the common random numbers
+    def select_witnesses(self, eligibilities, approximate_eligibility, num_witnesses, epoch, collateral, first_round_eligible_ranks=None, data_request=0):
+        # Release all collateral that became available
+        self.state.unlock_collateral(epoch)
 
-    def select_witnesses(self, eligibilities, approximate_eligibility, num_witnesses, epoch, collateral):
         # Select some witnesses based on eligibility
         for commit_round in range(self.commit_rounds):
-            # Find eligible witnesses
+            if self.common_random_numbers is not None:
+                uniforms = self.common_uniforms(epoch, data_request, commit_round)
+                eligible_ranks = self.draw_common_eligible_ranks(eligibilities, approximate_eligibility, num_witnesses, commit_round, uniforms[0])
+            elif commit_round == 0 and first_round_eligible_ranks is not None:
+                eligible_ranks = first_round_eligible_ranks
+            else:
+                eligible_ranks = self.draw_eligible_ranks(eligibilities, approximate_eligibility, num_witnesses, commit_round)
+
             eligibile_identities, insufficient_collateral = [], []
-            for identity, eligibility in eligibilities.items():
-                if approximate_eligibility:
-                    is_eligible = random.random() < eligibility * num_witnesses * (2 ** commit_round)
+            for rank in eligible_ranks:
+                index = eligibilities.identity(rank)
+                if self.identities[self.state.names[index]].can_witness(epoch, collateral):
+                    eligibile_identities.append(index)
                 else:
-                    is_eligible = min([random.random() for nw in range(num_witnesses * (2 ** commit_round))]) < eligibility
-                if is_eligible:
-                    if self.identities[identity].can_witness(epoch, collateral):
-                        eligibile_identities.append(identity)
-                    else:
-                        insufficient_collateral.append(identity)
+                    insufficient_collateral.append(index)
+            self.eligible_identities += len(eligible_ranks)
+            self.insufficient_collateral_identities += len(insufficient_collateral)
 
             # Remove the surplus in witnesses if necessary
             if len(eligibile_identities) >= num_witnesses:
-                chosen_eligibile_identities = random.sample(eligibile_identities, num_witnesses)
-                self.logger.debug(f"Chose {chosen_eligibile_identities} identities to solve the data request @ epoch {epoch}")
-                self.logger.debug(f"{list(set(eligibile_identities) - set(chosen_eligibile_identities))} identities not chosen to solve the data request @ epoch {epoch}")
+                if self.common_random_numbers is not None:
+                    # Choose the eligible identities with the lowest priorities
+                    priorities = uniforms[1][eligibile_identities]
+                    chosen_eligibile_identities = numpy.array(eligibile_identities)[numpy.argsort(priorities)[:num_witnesses]].tolist()
+                else:
+                    chosen_eligibile_identities = self.selection_rng.choice(eligibile_identities, num_witnesses, replace=False).tolist()
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug("Chose %s identities to solve the data request @ epoch %d", [self.state.names[index] for index in chosen_eligibile_identities], epoch)
+                    self.logger.debug("%s identities not chosen to solve the data request @ epoch %d", [self.state.names[index] for index in set(eligibile_identities) - set(chosen_eligibile_identities)], epoch)
 
                 # Mark collateral for all used identities as unavailable
-                for identity in chosen_eligibile_identities:
-                    self.identities[identity].mark_collateral(epoch, collateral, epoch + self.collateral_locked)
+                for index in chosen_eligibile_identities:
+                    self.identities[self.state.names[index]].mark_collateral(epoch, collateral, epoch + self.collateral_locked)
+
+                self.commit_rounds_used += commit_round + 1
 
                 return True, chosen_eligibile_identities, insufficient_collateral
 
+        self.unsolved_data_requests += 1
+        self.commit_rounds_used += self.commit_rounds
+
         return False, eligibile_identities, insufficient_collateral
 
+    # Counters recorded per block by the telemetry
+    def counters(self):
+        return self.unsolved_data_requests, self.commit_rounds_used, self.eligible_identities, self.insufficient_collateral_identities
+
     def get_ARS_created_reputation(self, new_witnessing_acts, epoch):
         created_reputation = min(new_witnessing_acts, self.total_reputation - self.current_reputation)
         self.current_reputation += created_reputation
-        self.logger.debug(f"Created {created_reputation} reputation for {new_witnessing_acts} witnessing acts")
+        self.logger.debug("Created %d reputation for %d witnessing acts", created_reputation, new_witnessing_acts)
         return created_reputation
 
     def get_ARS_expired_reputation(self, new_witnessing_acts, epoch):
@@ -220,11 +464,13 @@ class ARS:
 
         self.current_witnessing_acts += new_witnessing_acts
 
+        # Pop all expiring reputation gains from the global expiry heap and only visit their identities
+        witness_acts_expired = self.current_witnessing_acts - self.reputation_expire
         total_reputation_expired = 0
-        for identity in self.identities.values():
-            total_reputation_expired += identity.get_expired_reputation(self.current_witnessing_acts - self.reputation_expire, epoch, self.current_witnessing_acts)
+        for index in self.state.expiring_identities(witness_acts_expired):
+            total_reputation_expired += self.identities[self.state.names[index]].get_expired_reputation(witness_acts_expired, epoch, self.current_witnessing_acts)
 
-        self.logger.debug(f"Reputation expired @ epoch {epoch}: {total_reputation_expired}")
+        self.logger.debug("Reputation expired @ epoch %d: %d", epoch, total_reputation_expired)
 
         return total_reputation_expired
 
@@ -233,62 +479,120 @@ class ARS:
 
         reputation_gain = int(distribute_reputation / len(witnesses))
         for witness in witnesses:
-            self.identities[witness].update_reputation(self.reputation_expire, self.current_witnessing_acts, reputation_gain, epoch)
-        self.logger.debug(f"Distributed reputation @ epoch {epoch}: {reputation_gain * len(witnesses)}")
+            self.identities[self.state.names[witness]].update_reputation(self.reputation_expire, self.current_witnessing_acts, reputation_gain, epoch)
+        self.logger.debug("Distributed reputation @ epoch %d: %d", epoch, reputation_gain * len(witnesses))
 
         reputation_remainder = distribute_reputation - int(distribute_reputation / len(witnesses)) * len(witnesses)
-        self.logger.debug(f"Remaining reputation @ epoch {epoch}: {reputation_remainder}")
+        self.logger.debug("Remaining reputation @ epoch %d: %d", epoch, reputation_remainder)
 
         return reputation_remainder
 
+    # Complete state of the ARS, including the random number generators, as a dictionary of scalars and arrays
+    def snapshot(self):
+        reputation_gain_counts, reputation_gain_times, reputation_gains = self.state.reputation_gains.arrays()
+        return {
+            "collateral_locked": self.collateral_locked,
+            "current_reputation": self.current_reputation,
+            "current_witnessing_acts": self.current_witnessing_acts,
+            "unsolved_data_requests": self.unsolved_data_requests,
+            "state": self.state.snapshot(),
+            "reputation_gain_counts": reputation_gain_counts,
+            "reputation_gains": numpy.stack((reputation_gain_times, reputation_gains), axis=1),
+            "rng": self.rng.bit_generator.state,
+            "selection_rng": self.selection_rng.bit_generator.state,
+            "init_rng": self.init_rng.bit_generator.state,
+            "names_rng": self.names_rng.bit_generator.state,
+        }
+
+    def restore(self, snapshot):
+        assert self.collateral_locked == snapshot["collateral_locked"]
+
+        self.current_reputation = snapshot["current_reputation"]
+        self.current_witnessing_acts = snapshot["current_witnessing_acts"]
+        self.unsolved_data_requests = snapshot["unsolved_data_requests"]
+
+        # Identities
+        state = snapshot["state"]
+        self.create_identities(
+            state["names"].tolist(),
+            state["total_reputation"],
+            snapshot["reputation_gain_counts"],
+            snapshot["reputation_gains"][:, 0],
+            snapshot["reputation_gains"][:, 1],
+        )
+        self.state.restore(state)
+
+        self.eligibilities = None
+        self.eligibility_parameters = None
+
+        self.rng.bit_generator.state = snapshot["rng"]
+        self.selection_rng.bit_generator.state = snapshot["selection_rng"]
+        self.init_rng.bit_generator.state = snapshot["init_rng"]
+        self.names_rng.bit_generator.state = snapshot["names_rng"]
+
     def print_ARS(self):
         self.logger.info(f"{'Identity':<44}{'Reputation':>12}{'No collateral':>16}{'Data requests':>16}")
-        for identity in sorted(list(self.identities.values()), key=operator.attrgetter("total_reputation"), reverse=True):
+        for index in self.state.reputation_ranking().tolist():
+            identity = self.identities[self.state.names[index]]
             self.logger.info(f"{identity.name:<44}{identity.total_reputation:>12}{identity.eligible_no_collateral:>16}{identity.solved_data_requests:>16}")
 
-    def collect_stats(self, f_stats):
-        solved_data_requests, eligible_no_collateral = [], []
-        for identity in self.identities.values():
-            solved_data_requests.append(identity.solved_data_requests)
-            eligible_no_collateral.append(identity.eligible_no_collateral)
-
-        f_stats.write(f"Maximum data requests solved by one identity: {max(solved_data_requests)}\n")
-        f_stats.write(f"Maximum data requests eligible but not solved: {max(eligible_no_collateral)}\n\n")
-
-        percentiles = range(10, 100, 10)
+    # Statistics over the data requests solved and missed for lack of collateral per identity
+    def calculate_stats(self):
+        solved_data_requests, eligible_no_collateral = self.state.solved_data_requests, self.state.eligible_no_collateral
+        stats = {
+            "max_solved": int(solved_data_requests.max()),
+            "max_eligible_no_collateral": int(eligible_no_collateral.max()),
+            "percentiles": numpy.arange(10, 100, 10),
+        }
 
         # How many data request solved each identity if he solved at least one
-        solved_data_requests_without_zeros = list(filter(lambda x: x != 0, solved_data_requests))
-        solved_data_request_percentiles = numpy.percentile(solved_data_requests_without_zeros, percentiles)
-        for percentile, solved_data_request_percentile in zip(percentiles, solved_data_request_percentiles):
-            f_stats.write(f"Data requests solved per identity ({100 - percentile}%): {solved_data_request_percentile:.2f}\n")
-        f_stats.write(f"Average data requests solved per identity: {numpy.average(solved_data_requests_without_zeros):.2f}\n\n")
+        solved_data_requests_without_zeros = solved_data_requests[solved_data_requests != 0]
+        stats["solved_percentiles"] = numpy.percentile(solved_data_requests_without_zeros, stats["percentiles"])
+        stats["avg_solved"] = float(numpy.average(solved_data_requests_without_zeros))
 
         # Check how many identities where eligible to solve a data request but could not ignoring identities that never solved a data request
-        eligible_no_collateral_filtered = []
-        for solved, eligible in zip(solved_data_requests, eligible_no_collateral):
-            if solved > 0 or eligible > 0:
-                eligible_no_collateral_filtered.append(eligible)
-        eligible_no_collateral_percentiles = numpy.percentile(eligible_no_collateral_filtered, percentiles)
-        for percentile, eligible_no_collateral_percentile in zip(percentiles, eligible_no_collateral_percentiles):
-            f_stats.write(f"Data requests eligible but not solved per identity ({100 - percentile}%): {eligible_no_collateral_percentile:.2f}\n")
-        f_stats.write(f"Average data requests eligible but not solved per identity: {numpy.average(eligible_no_collateral_filtered):.2f}\n\n")
-
-        counter = 0
-        top_reputed_data_requests_solved = {100: [], 1000: []}
-        top_reputed_eligible_no_collateral = {100: [], 1000: []}
-        for identity in sorted(list(self.identities.values()), key=operator.attrgetter("total_reputation"), reverse=True):
-            for cutoff in top_reputed_data_requests_solved.keys():
-                if counter < cutoff:
-                    top_reputed_data_requests_solved[cutoff].append(identity.solved_data_requests)
-                    top_reputed_eligible_no_collateral[cutoff].append(identity.eligible_no_collateral)
-            counter += 1
-
-        for cutoff in top_reputed_data_requests_solved.keys():
-            f_stats.write(f"Top {cutoff} node average data requests solved: {numpy.average(top_reputed_data_requests_solved[cutoff]):.2f}\n")
-            f_stats.write(f"Top {cutoff} node eligble to solve but no collateral: {numpy.average(top_reputed_eligible_no_collateral[cutoff]):.2f}\n")
-        f_stats.write("\n")
+        eligible_no_collateral_filtered = eligible_no_collateral[(solved_data_requests > 0) | (eligible_no_collateral > 0)]
+        stats["eligible_no_collateral_percentiles"] = numpy.percentile(eligible_no_collateral_filtered, stats["percentiles"])
+        stats["avg_eligible_no_collateral"] = float(numpy.average(eligible_no_collateral_filtered))
+
+        ranking = self.state.reputation_ranking()
+        for cutoff in (100, 1000):
+            stats[f"top_{cutoff}_solved"] = float(numpy.average(solved_data_requests[ranking[:cutoff]]))
+            stats[f"top_{cutoff}_eligible_no_collateral"] = float(numpy.average(eligible_no_collateral[ranking[:cutoff]]))
+
+        return stats
+
+    def collect_stats(self, f_stats, stats=None):
+        if stats is None:
+            stats = self.calculate_stats()
+        write_stats(f_stats, stats)
+        return stats
 
     def clear_stats(self):
-        for identity in self.identities.values():
-            identity.clear_stats()
+        self.state.clear_stats()
+        self.unsolved_data_requests = 0
+
+# Write the statistics of calculate_stats, averaged statistics are followed by the half-width of their confidence interval
+def write_stats(f_stats, stats, intervals=None):
+    def statistic(name, index=None, spec=".2f"):
+        value = stats[name] if index is None else stats[name][index]
+        if intervals is None:
+            return f"{value:{spec}}"
+        interval = intervals[name] if index is None else intervals[name][index]
+        return f"{value:.2f} ± {interval:.2f}"
+
+    f_stats.write(f"Maximum data requests solved by one identity: {statistic('max_solved', spec='')}\n")
+    f_stats.write(f"Maximum data requests eligible but not solved: {statistic('max_eligible_no_collateral', spec='')}\n\n")
+
+    for i, percentile in enumerate(stats["percentiles"].tolist()):
+        f_stats.write(f"Data requests solved per identity ({100 - percentile}%): {statistic('solved_percentiles', i)}\n")
+    f_stats.write(f"Average data requests solved per identity: {statistic('avg_solved')}\n\n")
+
+    for i, percentile in enumerate(stats["percentiles"].tolist()):
+        f_stats.write(f"Data requests eligible but not solved per identity ({100 - percentile}%): {statistic('eligible_no_collateral_percentiles', i)}\n")
+    f_stats.write(f"Average data requests eligible but not solved per identity: {statistic('avg_eligible_no_collateral')}\n\n")
+
+    for cutoff in (100, 1000):
+        f_stats.write(f"Top {cutoff} node average data requests solved: {statistic(f'top_{cutoff}_solved')}\n")
+        f_stats.write(f"Top {cutoff} node eligble to solve but no collateral: {statistic(f'top_{cutoff}_eligible_no_collateral')}\n")
+    f_stats.write("\n")
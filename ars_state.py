@@ -0,0 +1,260 @@
+import array
+import bisect
+import heapq
+import numpy
+
+# Heaps hold (time, index) items packed into one integer, time in the high bits, so they order like the tuples
+INDEX_BITS = 32
+
+def heap_item(time, index):
+    return time << INDEX_BITS | index
+
+def heap_index(item):
+    return item & ((1 << INDEX_BITS) - 1)
+
+# Packed heap items of the items of all identities concatenated, given the number of items of every identity
+def heap_items(counts, times):
+    indices = numpy.repeat(numpy.arange(len(counts), dtype=numpy.int64), counts)
+    return ((numpy.asarray(times, dtype=numpy.int64) << INDEX_BITS) | indices).tolist()
+
+# One FIFO queue of (time, amount) items per identity, all threaded as linked lists through the same typed arrays
+# A few bytes per identity and per item instead of a deque per identity and a tuple per item
+class ItemQueues:
+    def __init__(self, queues, amount_type):
+        # Slot of the first and last item of every queue, -1 if it is empty
+        self.first = array.array("i", [-1]) * queues
+        self.last = array.array("i", [-1]) * queues
+        self.lengths = array.array("i", [0]) * queues
+
+        # Items by slot, next links to the following item of the same queue or of the free list
+        self.times = array.array("q")
+        self.amounts = array.array(amount_type)
+        self.next = array.array("i")
+        self.free = -1
+
+    def __len__(self):
+        return len(self.first)
+
+    def append(self, queue, time, amount):
+        if self.free >= 0:
+            slot = self.free
+            self.free = self.next[slot]
+            self.times[slot], self.amounts[slot], self.next[slot] = time, amount, -1
+        else:
+            slot = len(self.times)
+            self.times.append(time)
+            self.amounts.append(amount)
+            self.next.append(-1)
+
+        if self.last[queue] >= 0:
+            self.next[self.last[queue]] = slot
+        else:
+            self.first[queue] = slot
+        self.last[queue] = slot
+        self.lengths[queue] += 1
+
+    # The queue must not be empty
+    def first_time(self, queue):
+        return self.times[self.first[queue]]
+
+    def popleft(self, queue):
+        slot = self.first[queue]
+        self.first[queue] = self.next[slot]
+        if self.first[queue] < 0:
+            self.last[queue] = -1
+        self.lengths[queue] -= 1
+
+        self.next[slot] = self.free
+        self.free = slot
+        return self.times[slot], self.amounts[slot]
+
+    def items(self, queue):
+        items = []
+        slot = self.first[queue]
+        while slot >= 0:
+            items.append((self.times[slot], self.amounts[slot]))
+            slot = self.next[slot]
+        return items
+
+    # Fill empty queues at once, from the items of all queues concatenated in queue order and the length of every queue
+    def extend(self, counts, times, amounts):
+        assert all(length == 0 for length in self.lengths) and len(self.times) == 0
+        ends = numpy.cumsum(counts)
+        links = numpy.arange(1, len(times) + 1, dtype=numpy.int32)
+        links[ends[counts > 0] - 1] = -1
+
+        self.times = array.array("q", numpy.asarray(times, dtype=numpy.int64).tobytes())
+        self.amounts = array.array(self.amounts.typecode, numpy.asarray(amounts, dtype=self.amounts.typecode).tobytes())
+        self.next = array.array("i", links.tobytes())
+        self.first = array.array("i", numpy.where(counts > 0, ends - counts, -1).astype(numpy.int32).tobytes())
+        self.last = array.array("i", numpy.where(counts > 0, ends - 1, -1).astype(numpy.int32).tobytes())
+        self.lengths = array.array("i", numpy.asarray(counts, dtype=numpy.int32).tobytes())
+
+    # Items of all queues concatenated in queue order and the length of every queue, the inverse of extend
+    def arrays(self):
+        slots = array.array("i")
+        for queue in range(len(self)):
+            slot = self.first[queue]
+            while slot >= 0:
+                slots.append(slot)
+                slot = self.next[slot]
+        slots = numpy.frombuffer(slots, dtype=numpy.int32)
+        counts = numpy.frombuffer(self.lengths, dtype=numpy.int32).astype(numpy.int64)
+        return counts, numpy.frombuffer(self.times, dtype=numpy.int64)[slots], numpy.frombuffer(self.amounts, dtype=self.amounts.typecode)[slots]
+
+class ARSState:
+    def __init__(self, number_of_identities):
+        # Name table, an identity is referred to by its index in all arrays below
+        self.names = []
+
+        # Reputation, and per identity queue of (witnessing acts, amount) reputation gains
+        self.total_reputation = numpy.zeros(number_of_identities, dtype=numpy.int64)
+        self.reputation_gains = ItemQueues(0, "q")
+
+        # Min-heap of packed (witnessing acts, index) items, one for every reputation gain of every identity
+        self.reputation_expiry = []
+
+        # Identities as (-reputation, index) items ordered by reputation, built lazily and updated incrementally
+        self.ranking = None
+        self.ranked_reputation = numpy.zeros(number_of_identities, dtype=numpy.int64)
+        self.changed_reputation = set()
+        self.active_identities = 0
+        self.active_reputation = 0
+
+        # Collateral that can be used right now, a per identity queue of locked (collaterizable epoch, amount) UTXOs
+        # and a min-heap of packed (collaterizable epoch, index) items to release locked UTXOs as epochs advance
+        self.collaterizable_balance = numpy.zeros(number_of_identities, dtype=float)
+        self.locked_collateral = ItemQueues(0, "d")
+        self.collateral_unlocks = []
+
+        # Statistics
+        self.solved_data_requests = numpy.zeros(number_of_identities, dtype=numpy.int64)
+        self.eligible_no_collateral = numpy.zeros(number_of_identities, dtype=numpy.int64)
+
+    def __len__(self):
+        return len(self.names)
+
+    # Add the names of all identities at once, their reputation gains and UTXOs are added separately
+    def add_identities(self, names, total_reputation):
+        assert len(self.names) == 0 and len(names) <= len(self.total_reputation), "ARS state is full"
+
+        self.names = list(names)
+        self.total_reputation[:len(names)] = total_reputation
+        self.reputation_gains = ItemQueues(len(names), "q")
+        self.locked_collateral = ItemQueues(len(names), "d")
+
+    # Reputation gains have to be added in chronological order per identity
+    def gain_reputation(self, index, witnessing_acts, reputation):
+        self.reputation_gains.append(index, witnessing_acts, reputation)
+        heapq.heappush(self.reputation_expiry, heap_item(witnessing_acts, index))
+
+    # Add the reputation gains of all identities at once, given like the UTXOs of lock_collaterals
+    def gain_reputations(self, counts, witnessing_acts, reputations):
+        self.reputation_gains.extend(counts, witnessing_acts, reputations)
+
+        self.reputation_expiry = heap_items(counts, witnessing_acts)
+        heapq.heapify(self.reputation_expiry)
+
+    # Pop the expiry items of all reputation gains which expire before the given witnessing acts
+    # Returns the identities with expiring reputation, their gains are removed by expire_reputation
+    def expiring_identities(self, witness_acts_expired):
+        expiring_identities = set()
+        threshold = heap_item(witness_acts_expired, 0)
+        while len(self.reputation_expiry) > 0 and self.reputation_expiry[0] < threshold:
+            expiring_identities.add(heap_index(heapq.heappop(self.reputation_expiry)))
+        return expiring_identities
+
+    # Remove the gains at the front of the queue of an identity which expire before the given witnessing acts
+    # Returns the expired gains
+    def expire_reputation(self, index, witness_acts_expired):
+        expired = []
+        while self.reputation_gains.lengths[index] > 0 and self.reputation_gains.first_time(index) < witness_acts_expired:
+            expired.append(self.reputation_gains.popleft(index))
+        return expired
+
+    def set_reputation(self, index, total_reputation):
+        self.total_reputation[index] = total_reputation
+        if self.ranking is not None:
+            self.changed_reputation.add(index)
+
+    # Force a full rebuild of the ranking after writing to total_reputation directly
+    def invalidate_ranking(self):
+        self.ranking = None
+        self.changed_reputation.clear()
+
+    # Identities ordered by reputation, ties are kept in insertion order
+    def reputation_ranking(self):
+        return numpy.argsort(-self.total_reputation, kind="stable")
+
+    # Bring the ranking up to date with all reputation changes since the last update
+    # Returns whether the ranking changed
+    def update_ranking(self):
+        if self.ranking is None:
+            self.ranking = sorted(zip((-self.total_reputation).tolist(), range(len(self))))
+            self.ranked_reputation = self.total_reputation.copy()
+            self.active_identities = int(numpy.count_nonzero(self.total_reputation > 0))
+            self.active_reputation = int(self.total_reputation.sum())
+            return True
+
+        changed = False
+        for index in self.changed_reputation:
+            old_reputation, new_reputation = int(self.ranked_reputation[index]), int(self.total_reputation[index])
+            if old_reputation == new_reputation:
+                continue
+
+            # Move the identity to its new rank
+            del self.ranking[bisect.bisect_left(self.ranking, (-old_reputation, index))]
+            bisect.insort(self.ranking, (-new_reputation, index))
+            self.ranked_reputation[index] = new_reputation
+
+            self.active_identities += (new_reputation > 0) - (old_reputation > 0)
+            self.active_reputation += new_reputation - old_reputation
+            changed = True
+        self.changed_reputation.clear()
+
+        return changed
+
+    # Locked UTXOs of an identity have to be added in chronological order
+    def lock_collateral(self, index, collaterizable_epoch, amount):
+        self.locked_collateral.append(index, collaterizable_epoch, amount)
+        heapq.heappush(self.collateral_unlocks, heap_item(collaterizable_epoch, index))
+
+    # Lock the UTXOs of all identities at once, given as the UTXOs of all identities concatenated in chronological order
+    # per identity together with the number of UTXOs of every identity
+    def lock_collaterals(self, counts, collaterizable_epochs, amounts):
+        self.locked_collateral.extend(counts, collaterizable_epochs, amounts)
+
+        self.collateral_unlocks = heap_items(counts, collaterizable_epochs)
+        heapq.heapify(self.collateral_unlocks)
+
+    # Release all UTXOs which can be used as collateral at this epoch
+    def unlock_collateral(self, epoch):
+        threshold = heap_item(epoch + 1, 0)
+        while len(self.collateral_unlocks) > 0 and self.collateral_unlocks[0] < threshold:
+            index = heap_index(heapq.heappop(self.collateral_unlocks))
+            self.collaterizable_balance[index] += self.locked_collateral.popleft(index)[1]
+
+    # Complete state as a dictionary of arrays, the ranking and heaps are rebuilt on restore
+    def snapshot(self):
+        counts, collaterizable_epochs, amounts = self.locked_collateral.arrays()
+        return {
+            "names": numpy.array(self.names),
+            "total_reputation": self.total_reputation.copy(),
+            "solved_data_requests": self.solved_data_requests.copy(),
+            "eligible_no_collateral": self.eligible_no_collateral.copy(),
+            "collaterizable_balance": self.collaterizable_balance.copy(),
+            "locked_collateral_counts": counts,
+            "locked_collateral": numpy.stack((collaterizable_epochs, amounts), axis=1).astype(float),
+        }
+
+    # Restore everything but the names and reputation gains, which are added when creating the identities
+    def restore(self, snapshot):
+        self.solved_data_requests[:] = snapshot["solved_data_requests"]
+        self.eligible_no_collateral[:] = snapshot["eligible_no_collateral"]
+        self.collaterizable_balance[:] = snapshot["collaterizable_balance"]
+
+        self.lock_collaterals(snapshot["locked_collateral_counts"], snapshot["locked_collateral"][:, 0].astype(numpy.int64), snapshot["locked_collateral"][:, 1])
+
+    def clear_stats(self):
+        self.solved_data_requests.fill(0)
+        self.eligible_no_collateral.fill(0)
@@ -0,0 +1,212 @@
+#!/usr/bin/python3
+
+import json
+import multiprocessing
+import optparse
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy
+
+import simulator
+from data_requests import read_data_requests_files
+
+INPUT_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "input")
+
+# Canonical scenarios as (name, simulation options), options which are not given keep their command line default
+# Synthetic ARS have as many reputation levels as identities, so half of them can get a distinct reputation
+SCENARIOS = [
+    ("real-june", dict(ars_file=os.path.join(INPUT_DIR, "ars_20220804.csv.bz2"), data_requests_file=os.path.join(INPUT_DIR, "data_requests_202206.csv.bz2"), warmup_epochs=1000, detailed_epochs=5000)),
+    ("real-july", dict(ars_file=os.path.join(INPUT_DIR, "ars_20220804.csv.bz2"), data_requests_file=os.path.join(INPUT_DIR, "data_requests_202207.csv.bz2"), warmup_epochs=1000, detailed_epochs=5000)),
+    ("synthetic-1k-2", dict(create_random_ars=True, identities=1000, max_reputation=10000, avg_data_requests=2, detailed_epochs=5000)),
+    ("synthetic-1k-4", dict(create_random_ars=True, identities=1000, max_reputation=10000, avg_data_requests=4, detailed_epochs=5000)),
+    ("synthetic-10k-2", dict(create_random_ars=True, identities=10000, max_reputation=10000, avg_data_requests=2, detailed_epochs=2000)),
+    ("synthetic-10k-4", dict(create_random_ars=True, identities=10000, max_reputation=10000, avg_data_requests=4, detailed_epochs=2000)),
+    ("synthetic-100k-2", dict(create_random_ars=True, identities=100000, max_reputation=100000, avg_data_requests=2, detailed_epochs=500)),
+    ("synthetic-100k-4", dict(create_random_ars=True, identities=100000, max_reputation=100000, avg_data_requests=4, detailed_epochs=500)),
+    ("approximate-10k-4", dict(create_random_ars=True, identities=10000, max_reputation=10000, avg_data_requests=4, detailed_epochs=2000, approximate_eligibility=True)),
+    ("collateral-short-10k-4", dict(create_random_ars=True, identities=10000, max_reputation=10000, avg_data_requests=4, detailed_epochs=2000, collateral_locked=100)),
+    ("collateral-long-10k-4", dict(create_random_ars=True, identities=10000, max_reputation=10000, avg_data_requests=4, detailed_epochs=2000, collateral_locked=26880)),
+]
+
+# Simulate the same seeded workload with the log file at every level, stdout stays silent so only the cost of
+# generating and writing the records is measured
+def benchmark_logging(options):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for level in options.log_levels.split(","):
+            log_path = os.path.join(tmp_dir, f"{level}.log")
+            result = simulator.main([
+                "--identities", str(options.identities),
+                "--balance", str(options.balance),
+                "--collateral-locked", str(options.collateral_locked),
+                "--avg-data-requests", str(options.avg_data_requests),
+                "--simulation-epochs", str(options.simulation_epochs),
+                "--seed", str(options.seed),
+                "--log-stdout", "critical",
+                "--log-file", level,
+                "--log-path", log_path,
+                "--stats-file", os.path.join(tmp_dir, f"{level}.stats"),
+                "--no-result-cache",
+            ])
+            results.append((level, result.seconds, os.path.getsize(log_path)))
+
+    print(f"{'Log level':<12}{'Seconds':>10}{'Overhead':>10}{'Log size (MB)':>16}")
+    for level, seconds, log_size in results:
+        print(f"{level:<12}{seconds:>10.2f}{(seconds / results[0][1] - 1) * 100:>9.1f}%{log_size / 1E6:>16.2f}")
+
+def scenario_options(scenario_kwargs, epochs_scale, seed):
+    kwargs = dict(scenario_kwargs, seed=seed, log_stdout="critical", log_file="critical")
+    kwargs["detailed_epochs"] = max(1, int(kwargs["detailed_epochs"] * epochs_scale))
+    return kwargs
+
+# Runs in a fresh process, so the peak resident set size is that of this scenario alone
+# Reading the inputs and creating the ARS are timed separately from the simulation itself
+def run_scenario(kwargs):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        options = simulator.simulation_options(**kwargs, log_path=os.path.join(tmp_dir, "simulation.log"))
+
+        start = time.perf_counter()
+        data_requests = read_data_requests_files(options.data_requests_file) if options.data_requests_file else None
+        # The ARS is created from the same stream as a command line run with this seed
+        ars_seed, workload_seed = simulator.seed_sequences(options)
+        ars = simulator.create_ARS(options, ars_seed)
+        setup_seconds = time.perf_counter() - start
+
+        result = simulator.run_simulation(options, ars=ars, data_requests=data_requests)
+        simulator.stop_loggers()
+
+    epochs = result.warmup_epochs + result.detailed_epochs
+    data_requests = result.total_warmup_data_requests + result.total_detailed_data_requests
+    return {
+        "setup_seconds": setup_seconds,
+        "seconds": result.seconds,
+        "epochs": epochs,
+        "data_requests": data_requests,
+        "epochs_per_second": epochs / result.seconds,
+        "data_requests_per_second": data_requests / result.seconds,
+        # Kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+# The fastest of the repeats is kept, it is the one least disturbed by other load on the machine
+def benchmark_scenarios(scenarios, options):
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for name, scenario_kwargs in scenarios:
+        kwargs = scenario_options(scenario_kwargs, options.epochs_scale, options.seed)
+        # Convert the data requests files once up front, so the conversion is not measured
+        if kwargs.get("data_requests_file"):
+            read_data_requests_files(kwargs["data_requests_file"])
+
+        runs = []
+        for repeat in range(options.repeats):
+            with context.Pool(1, maxtasksperchild=1) as pool:
+                runs.append(pool.apply(run_scenario, (kwargs,)))
+        results[name] = max(runs, key=lambda run: run["epochs_per_second"])
+        results[name]["options"] = kwargs
+        results[name]["peak_rss_mb"] = max(run["peak_rss_mb"] for run in runs)
+
+        result = results[name]
+        print(f"{name:<26}{result['epochs_per_second']:>12.1f}{result['data_requests_per_second']:>14.1f}{result['peak_rss_mb']:>12.1f}{result['setup_seconds']:>10.2f}{result['seconds']:>10.2f}", flush=True)
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.realpath(__file__)), capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def read_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+# Compare every scenario with the most recent earlier run of it with identical options
+# Returns the scenarios that slowed down by more than the threshold
+def compare(history, results, threshold):
+    regressions = []
+    print(f"\n{'Scenario':<26}{'Baseline':>12}{'Current':>12}{'Change':>10}")
+    for name, result in results.items():
+        baseline = next((entry for entry in reversed(history) if name in entry["scenarios"] and entry["scenarios"][name]["options"] == result["options"]), None)
+        if baseline is None:
+            print(f"{name:<26}{'-':>12}{result['epochs_per_second']:>12.1f}{'-':>10}")
+            continue
+
+        baseline_result = baseline["scenarios"][name]
+        change = result["epochs_per_second"] / baseline_result["epochs_per_second"] - 1
+        regression = change < -threshold
+        print(f"{name:<26}{baseline_result['epochs_per_second']:>12.1f}{result['epochs_per_second']:>12.1f}{change * 100:>9.1f}%{'  FAIL' if regression else ''}")
+        if regression:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = optparse.OptionParser()
+
+    # Scenario benchmark options
+    parser.add_option("--scenarios", type="string", dest="scenarios", help="Comma-separated scenarios to run, all by default: " + ",".join(name for name, kwargs in SCENARIOS))
+    parser.add_option("--epochs-scale", type="float", dest="epochs_scale", default=1.0, help="Scale the number of epochs of every scenario, only runs with the same scale are compared")
+    parser.add_option("--repeats", type="int", dest="repeats", default=1, help="Number of times to run every scenario, the fastest run is kept")
+    parser.add_option("--history", type="string", dest="history", default=os.path.join("results", "benchmark_history.json"), help="JSON file with the results of earlier benchmarks, the results are appended to it")
+    parser.add_option("--threshold", type="float", dest="threshold", default=0.1, help="Fail if a scenario is this fraction slower than its previous run")
+    parser.add_option("--no-save", action="store_false", dest="save", default=True, help="Compare against the history without appending the results to it")
+
+    # Logging benchmark options
+    parser.add_option("--logging", action="store_true", dest="logging", default=False, help="Measure the overhead of every log level instead of running the scenarios")
+    parser.add_option("--identities", type="int", dest="identities", default=1000, help="Number of identities to create")
+    parser.add_option("--balance", type="int", dest="balance", default=100, help="Balance of each ARS identity in WIT")
+    parser.add_option("--collateral-locked", type="int", dest="collateral_locked", default=1000, help="Time in epochs collateral will be locked after being used")
+    parser.add_option("--avg-data-requests", type="int", dest="avg_data_requests", default=4, help="Average number of data requests in a block")
+    parser.add_option("--simulation-epochs", type="int", dest="simulation_epochs", default=2000, help="Number of epochs to simulate per measurement")
+    parser.add_option("--seed", type="int", dest="seed", default=1, help="Seed of the simulated workload")
+    parser.add_option("--log-levels", type="string", dest="log_levels", default="critical,warning,info,debug", help="Comma-separated log levels to measure, the first one is the baseline")
+
+    options, args = parser.parse_args()
+
+    if options.logging:
+        benchmark_logging(options)
+        return
+
+    scenarios = SCENARIOS
+    if options.scenarios:
+        names = options.scenarios.split(",")
+        unknown = set(names) - set(name for name, kwargs in SCENARIOS)
+        if unknown:
+            print(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+            sys.exit(1)
+        scenarios = [(name, kwargs) for name, kwargs in SCENARIOS if name in names]
+
+    print(f"{'Scenario':<26}{'Epochs/s':>12}{'Requests/s':>14}{'Peak MB':>12}{'Setup s':>10}{'Sim s':>10}")
+    results = benchmark_scenarios(scenarios, options)
+
+    history = read_history(options.history)
+    regressions = compare(history, results, options.threshold)
+
+    if options.save:
+        if os.path.dirname(options.history) and not os.path.exists(os.path.dirname(options.history)):
+            os.makedirs(os.path.dirname(options.history))
+        history.append({
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "numpy": numpy.__version__,
+            "cpus": os.cpu_count(),
+            "scenarios": results,
+        })
+        with open(options.history + ".tmp", "w") as f:
+            json.dump(history, f, indent=1)
+        os.replace(options.history + ".tmp", options.history)
+
+    if regressions:
+        print(f"\n{len(regressions)} scenarios slowed down by more than {options.threshold * 100:.0f}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
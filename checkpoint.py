@@ -0,0 +1,91 @@
+import hashlib
+import os
+import pickle
+
+from ARS import ARS
+
+CHECKPOINT_VERSION = 5
+
+# Options that determine the state of the ARS after the warmup phase
+WARMUP_OPTIONS = [
+    "collateral_locked",
+    "identities",
+    "balance",
+    "create_random_ars",
+    "max_reputation",
+    "zero_reputation_ratio",
+    "avg_data_requests",
+    "std_data_requests",
+    "witnesses",
+    "collateral",
+    "ars_file",
+    "data_requests_file",
+    "offset_epochs",
+    "warmup_epochs",
+    "approximate_eligibility",
+    "batch_data_requests",
+    "seed",
+    "replica",
+    "common_random_numbers",
+    "warmup_stationarity",
+    "batch_epochs",
+    "min_batches",
+]
+
+# Options that determine the state of the ARS at any point in the simulation
+SIMULATION_OPTIONS = WARMUP_OPTIONS + [
+    "detailed_epochs",
+    "target_precision",
+]
+
+def checkpoints_dir():
+    checkpoints_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "checkpoints")
+    if not os.path.exists(checkpoints_dir):
+        os.mkdir(checkpoints_dir)
+    return checkpoints_dir
+
+# Hash a comma-separated list of input files by content
+def hash_files(filenames):
+    file_hash = hashlib.sha256()
+    for filename in filenames.split(","):
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+def hash_options(options, option_names):
+    options_hash = hashlib.sha256()
+    for option_name in option_names:
+        value = getattr(options, option_name)
+        # Input files are identified by their content rather than by their name
+        if option_name in ("ars_file", "data_requests_file") and value:
+            value = hash_files(value)
+        options_hash.update(f"{option_name}={value!r}\n".encode("utf-8"))
+    return options_hash.hexdigest()[:16]
+
+def warmup_checkpoint_path(options):
+    return os.path.join(checkpoints_dir(), f"warmup.{hash_options(options, WARMUP_OPTIONS)}.ckpt")
+
+def run_checkpoint_path(options):
+    return os.path.join(checkpoints_dir(), f"run.{hash_options(options, SIMULATION_OPTIONS)}.ckpt")
+
+# Write the ARS and simulator state, the checkpoint is replaced atomically so an interrupted write never leaves a corrupt file
+def save_checkpoint(path, ars, simulation):
+    checkpoint = {
+        "version": CHECKPOINT_VERSION,
+        "ars": ars.snapshot(),
+        "simulation": simulation,
+    }
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+def load_checkpoint(path, log_stdout, log_file, log_path="simulation.log"):
+    with open(path, "rb") as f:
+        checkpoint = pickle.load(f)
+    assert checkpoint["version"] == CHECKPOINT_VERSION, f"Unsupported checkpoint version {checkpoint['version']}"
+
+    ars = ARS(log_stdout, log_file, checkpoint["ars"]["collateral_locked"], log_path)
+    ars.restore(checkpoint["ars"])
+
+    return ars, checkpoint["simulation"]
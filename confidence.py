@@ -0,0 +1,24 @@
+import math
+import numpy
+
+# Two-sided 95% quantiles of the Student t-distribution for 1 to 30 degrees of freedom
+T_QUANTILES = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]
+
+def t_quantile(degrees_of_freedom):
+    if degrees_of_freedom <= len(T_QUANTILES):
+        return T_QUANTILES[degrees_of_freedom - 1]
+    # Cornish-Fisher expansion around the normal quantile, accurate to three decimals from 30 degrees of freedom
+    z = 1.959964
+    return z + (z ** 3 + z) / (4 * degrees_of_freedom)
+
+# Mean and half-width of the 95% confidence interval of independent samples, samples can be scalars or arrays
+def confidence_interval(samples):
+    samples = numpy.asarray(samples, dtype=float)
+    mean = samples.mean(axis=0)
+    if len(samples) < 2:
+        return mean, numpy.full_like(mean, math.nan)
+    return mean, t_quantile(len(samples) - 1) * samples.std(axis=0, ddof=1) / math.sqrt(len(samples))
@@ -0,0 +1,127 @@
+import numpy
+
+from confidence import confidence_interval
+
+PERCENTILES = numpy.arange(10, 100, 10)
+
+# Families of batch statistics, the precision of a statistic is relative to the largest mean in its family so rare
+# events in the lower percentiles, which are nearly always zero, do not dominate
+STATISTIC_FAMILIES = [
+    slice(0, 1),
+    slice(1, 1 + len(PERCENTILES)),
+    slice(1 + len(PERCENTILES), 1 + 2 * len(PERCENTILES)),
+    slice(1 + 2 * len(PERCENTILES), 3 + 2 * len(PERCENTILES)),
+]
+
+def percentiles(values):
+    return numpy.percentile(values, PERCENTILES) if len(values) > 0 else numpy.zeros(len(PERCENTILES))
+
+# Ends the detailed phase once the statistics reported for it are known to the target relative precision
+# The phase is split in batches of epochs and every batch yields one sample of the statistics, calculated from the counters
+# accumulated during the batch normalized per epoch: the unsolved data request rate, the percentiles of data requests
+# solved and eligible but not solved per identity and the eligible but not solved averages of the top 100 and 1000
+# Batches of enough epochs are nearly independent, so their mean has a confidence interval like independent samples
+class ConvergenceMonitor:
+    def __init__(self, first_epoch, batch_epochs, min_batches, target_precision):
+        self.batch_epochs = batch_epochs
+        self.min_batches = min_batches
+        self.target_precision = target_precision
+
+        self.batch_start = first_epoch
+        self.next_batch = first_epoch + batch_epochs
+        self.batches = []
+
+        # Counters at the start of the current batch
+        self.solved_data_requests = None
+        self.eligible_no_collateral = None
+        self.unsolved_data_requests = 0
+        self.total_data_requests = 0
+
+    # Statistics of the batch ending before the given epoch
+    def batch_statistics(self, ars, epoch, total_data_requests):
+        solved_data_requests, eligible_no_collateral = ars.state.solved_data_requests, ars.state.eligible_no_collateral
+        if self.solved_data_requests is not None:
+            solved_data_requests = solved_data_requests - self.solved_data_requests
+            eligible_no_collateral = eligible_no_collateral - self.eligible_no_collateral
+        epochs = epoch - self.batch_start
+
+        data_requests = total_data_requests - self.total_data_requests
+        unsolved_rate = (ars.unsolved_data_requests - self.unsolved_data_requests) / data_requests if data_requests > 0 else 0
+
+        ranking = ars.state.reputation_ranking()
+        return numpy.concatenate((
+            [unsolved_rate],
+            percentiles(solved_data_requests[solved_data_requests != 0]) / epochs,
+            percentiles(eligible_no_collateral[(solved_data_requests > 0) | (eligible_no_collateral > 0)]) / epochs,
+            [eligible_no_collateral[ranking[:cutoff]].mean() / epochs for cutoff in (100, 1000)],
+        ))
+
+    # Worst half-width of the confidence intervals over all statistics, relative to the largest mean of their family
+    def precision(self):
+        if len(self.batches) < 2:
+            return numpy.inf
+        mean, interval = confidence_interval(self.batches)
+        precision = 0
+        for family in STATISTIC_FAMILIES:
+            scale, half_width = numpy.abs(mean[family]).max(), interval[family].max()
+            if half_width > 0:
+                precision = max(precision, half_width / scale)
+        return float(precision)
+
+    # Called before simulating the block at the given epoch, returns whether the phase can end before it
+    def update(self, ars, epoch, total_data_requests):
+        if epoch < self.next_batch:
+            return False
+
+        self.batches.append(self.batch_statistics(ars, epoch, total_data_requests))
+
+        self.batch_start = epoch
+        self.next_batch = epoch + self.batch_epochs
+        self.solved_data_requests = ars.state.solved_data_requests.copy()
+        self.eligible_no_collateral = ars.state.eligible_no_collateral.copy()
+        self.unsolved_data_requests = ars.unsolved_data_requests
+        self.total_data_requests = total_data_requests
+
+        return len(self.batches) >= self.min_batches and self.precision() <= self.target_precision
+
+# Ends the warmup once the reputation distribution is stationary
+# Every batch of epochs yields one sample of the distribution: the fraction of identities with reputation and the share of
+# all reputation held by the top 100 and 1000 identities
+# The distribution is stationary once the means of the older and newer half of the last batches differ by less than the
+# tolerance, relative to their mean, and the warmup lasted long enough to fill the collateral and reputation expiry lists
+class StationarityMonitor:
+    def __init__(self, first_epoch, batch_epochs, min_batches, tolerance, min_epochs):
+        self.batch_epochs = batch_epochs
+        self.min_batches = min_batches
+        self.tolerance = tolerance
+        self.min_epoch = first_epoch + min_epochs
+
+        self.next_batch = first_epoch + batch_epochs
+        self.batches = []
+
+    def distribution_statistics(self, ars):
+        reputation = ars.state.total_reputation[ars.state.reputation_ranking()]
+        total_reputation = max(int(reputation.sum()), 1)
+        return numpy.array([
+            numpy.count_nonzero(reputation) / len(reputation),
+            reputation[:100].sum() / total_reputation,
+            reputation[:1000].sum() / total_reputation,
+        ])
+
+    def drift(self):
+        if len(self.batches) < self.min_batches:
+            return numpy.inf
+        window = numpy.array(self.batches[-self.min_batches:])
+        older, newer = window[:self.min_batches // 2].mean(axis=0), window[self.min_batches // 2:].mean(axis=0)
+        mean = window.mean(axis=0)
+        return float((numpy.abs(newer - older) / numpy.where(mean != 0, mean, 1)).max())
+
+    # Called before simulating the block at the given epoch, returns whether the phase can end before it
+    def update(self, ars, epoch, total_data_requests):
+        if epoch < self.next_batch:
+            return False
+
+        self.batches.append(self.distribution_statistics(ars))
+        self.next_batch = epoch + self.batch_epochs
+
+        return epoch >= self.min_epoch and self.drift() <= self.tolerance
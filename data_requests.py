@@ -0,0 +1,164 @@
+import array
+import hashlib
+import itertools
+import numpy
+import os
+import shutil
+import tempfile
+
+from file_manager import open_file
+
+CACHE_VERSION = 1
+
+COLUMNS = ("epochs", "offsets", "witnesses", "collateral")
+
+# Data requests of all epochs stored as columns, the data requests of the i-th epoch in epochs are stored in
+# witnesses and collateral between offsets[i] and offsets[i + 1]
+class DataRequests:
+    def __init__(self, epochs, offsets, witnesses, collateral):
+        self.epochs = epochs
+        self.offsets = offsets
+        self.witnesses = witnesses
+        self.collateral = collateral
+
+    def __len__(self):
+        return len(self.witnesses)
+
+    def max_epoch(self):
+        return int(self.epochs[-1]) if len(self.epochs) > 0 else 0
+
+    # Yield (epoch, data requests) for all epochs in [first_epoch, last_epoch) that contain data requests
+    def events(self, first_epoch, last_epoch):
+        first, last = numpy.searchsorted(self.epochs, [first_epoch, last_epoch]).tolist()
+        for epoch, start, end in zip(self.epochs[first:last].tolist(), self.offsets[first:last].tolist(), self.offsets[first + 1:last + 1].tolist()):
+            yield epoch, list(zip(self.witnesses[start:end].tolist(), self.collateral[start:end].tolist()))
+
+def cache_dir():
+    cache_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "cache")
+    if not os.path.exists(cache_dir):
+        os.mkdir(cache_dir)
+    return cache_dir
+
+# The cache is keyed by the path, modification time and size of the source files, so it is invalidated when any of them changes
+def cache_key(data_requests_files):
+    key = hashlib.sha256(f"version={CACHE_VERSION}\n".encode("utf-8"))
+    for data_requests_file in data_requests_files.split(","):
+        stat = os.stat(data_requests_file)
+        key.update(f"{os.path.realpath(data_requests_file)},{stat.st_mtime_ns},{stat.st_size}\n".encode("utf-8"))
+    return key.hexdigest()[:16]
+
+# Yield (epoch, witnesses, collateral) for every data request in the comma-separated files in chronological order
+# Epochs are normalized to the first data request of the first file and data requests before skip_epoch are skipped
+# without parsing them, a file is skipped without reading it at all if the next file starts before skip_epoch
+def read_data_requests(data_requests_files, skip_epoch=0):
+    first_epoch, previous_epoch = None, 0
+
+    filenames = data_requests_files.split(",")
+    f = open_file(filenames[0])
+    line = f.readline()
+    for i in range(len(filenames)):
+        if i + 1 < len(filenames):
+            next_f = open_file(filenames[i + 1])
+            next_line = next_f.readline()
+        else:
+            next_f, next_line = None, ""
+
+        if first_epoch is None and line:
+            first_epoch = int(line[:line.index(",")])
+
+        if not next_line or int(next_line[:next_line.index(",")]) - first_epoch >= skip_epoch:
+            for line in itertools.chain([line] if line else [], f):
+                epoch = int(line[:line.index(",")]) - first_epoch
+                assert epoch >= previous_epoch, "Are the supplied data requests files in chronological order?"
+                previous_epoch = epoch
+
+                if epoch >= skip_epoch:
+                    # The data request hash is never used
+                    _, _, witnesses, collateral = line.split(",")
+                    yield epoch, int(witnesses), int(collateral) / 1E9
+        f.close()
+
+        f, line = next_f, next_line
+
+def parse_data_requests_files(data_requests_files):
+    epochs, witnesses, collateral = array.array("q"), array.array("q"), array.array("d")
+    for epoch, data_request_witnesses, data_request_collateral in read_data_requests(data_requests_files):
+        epochs.append(epoch)
+        witnesses.append(data_request_witnesses)
+        collateral.append(data_request_collateral)
+
+    epochs = numpy.frombuffer(epochs, dtype=numpy.int64)
+    unique_epochs, starts = numpy.unique(epochs, return_index=True)
+    offsets = numpy.append(starts, len(epochs)).astype(numpy.int64)
+
+    return DataRequests(unique_epochs, offsets, numpy.frombuffer(witnesses, dtype=numpy.int64), numpy.frombuffer(collateral, dtype=float))
+
+# Data requests read lazily from the input files, phases have to be simulated in chronological order
+# Only the data requests of a single epoch are kept in memory, independent of the number of files
+class DataRequestsStream:
+    def __init__(self, data_requests_files):
+        self.data_requests_files = data_requests_files
+        self.data_requests = None
+        # Data requests read from the input files which were not yielded yet
+        self.pending = []
+        self.exhausted = False
+
+        # Last epoch with data requests read from the input files
+        self.last_epoch = -1
+
+    def read(self, first_epoch):
+        for epoch, witnesses, collateral in read_data_requests(self.data_requests_files, first_epoch):
+            self.last_epoch = epoch
+            yield epoch, witnesses, collateral
+        self.exhausted = True
+
+    # Yield (epoch, data requests) for all epochs in [first_epoch, last_epoch) that contain data requests, data
+    # requests read past the end of the window are kept for the next one
+    def events(self, first_epoch, last_epoch):
+        if self.data_requests is None:
+            self.data_requests = self.read(first_epoch)
+
+        while True:
+            if not self.pending:
+                data_request = next(self.data_requests, None)
+                if data_request is None:
+                    return
+                self.pending.append(data_request)
+            epoch = self.pending[0][0]
+            if epoch >= last_epoch:
+                return
+
+            # Data requests of the next epoch stay pending
+            while self.pending[-1][0] == epoch:
+                data_request = next(self.data_requests, None)
+                if data_request is None:
+                    break
+                self.pending.append(data_request)
+            count = sum(1 for data_request in self.pending if data_request[0] == epoch)
+            epoch_data_requests, self.pending = self.pending[:count], self.pending[count:]
+
+            if epoch >= first_epoch:
+                yield epoch, [(witnesses, collateral) for _, witnesses, collateral in epoch_data_requests]
+
+    # Return the data requests of an epoch yielded by events but not simulated, so the next window yields them again
+    def unread(self, epoch, data_requests):
+        self.pending = [(epoch, witnesses, collateral) for witnesses, collateral in data_requests] + self.pending
+
+# Read the data requests from their binary cache, converting the source files on first use
+# Columns are memory-mapped, so concurrent simulations reading the same cache share its pages
+def read_data_requests_files(data_requests_files):
+    path = os.path.join(cache_dir(), f"data_requests.{cache_key(data_requests_files)}")
+    if not os.path.exists(path):
+        data_requests = parse_data_requests_files(data_requests_files)
+
+        # Write to a temporary directory which is renamed once complete, if another process converted the same
+        # files in the meantime its cache is kept
+        tmp_path = tempfile.mkdtemp(dir=cache_dir())
+        for column in COLUMNS:
+            numpy.save(os.path.join(tmp_path, column + ".npy"), getattr(data_requests, column))
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            shutil.rmtree(tmp_path)
+
+    return DataRequests(*[numpy.load(os.path.join(path, column + ".npy"), mmap_mode="r") for column in COLUMNS])
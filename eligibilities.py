@@ -0,0 +1,44 @@
+import numpy
+
+# Eligibility of all identities in the ARS for one block
+# Probabilities are stored per reputation rank, the ranking maps a rank to the identity index
+# The ranking is shared with the ARS state, so an instance is only valid until reputations are updated again
+class Eligibilities:
+    def __init__(self, ranking, probabilities):
+        self.ranking = ranking
+        self.probabilities = probabilities
+
+        # Per commit round eligibility probabilities, calculated on first use
+        self.round_probabilities = {}
+
+        # Runs of consecutive ranks sharing the same eligibility, calculated on first use
+        self.group_starts = None
+        self.group_sizes = None
+
+        # Identity index of every rank, calculated on first use
+        self.identity_indices = None
+
+    def __len__(self):
+        return len(self.probabilities)
+
+    def identity(self, rank):
+        return self.ranking[rank][1]
+
+    # Eligibilities are non-increasing with the rank, so identities sharing an eligibility form runs of ranks
+    def groups(self):
+        if self.group_starts is None:
+            boundaries = numpy.flatnonzero(self.probabilities[1:] != self.probabilities[:-1]) + 1
+            self.group_starts = numpy.concatenate(([0], boundaries))
+            self.group_sizes = numpy.diff(numpy.append(self.group_starts, len(self.probabilities)))
+        return self.group_starts, self.group_sizes
+
+    def identities(self):
+        if self.identity_indices is None:
+            self.identity_indices = numpy.array([index for _, index in self.ranking], dtype=numpy.int64)
+        return self.identity_indices
+
+    # Eligibilities aligned with the identity indices of the ARS state
+    def by_identity(self):
+        eligibilities = numpy.empty(len(self.probabilities), dtype=float)
+        eligibilities[self.identities()] = self.probabilities
+        return eligibilities
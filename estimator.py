@@ -0,0 +1,230 @@
+#!/usr/bin/python3
+
+import csv
+import math
+import optparse
+import os
+import shlex
+import time
+
+import numpy
+
+import simulator
+import sweep
+from data_requests import read_data_requests_files
+
+# Columns of the estimates table, named like the statistics of a simulation where they estimate the same quantity
+ESTIMATE_COLUMNS = [
+    "data_requests_per_epoch",
+    "unsolved_rate",
+    "avg_solved",
+    "avg_eligible_no_collateral",
+    "top_100_solved",
+    "top_100_eligible_no_collateral",
+    "top_1000_solved",
+    "top_1000_eligible_no_collateral",
+    "starved_identities",
+    "milliseconds",
+]
+
+# Probabilities of 0 to max_count events of a Poisson distribution for every mean
+def poisson_pmf(means, max_count):
+    counts = numpy.arange(max_count + 1)
+    log_factorials = numpy.concatenate(([0], numpy.cumsum(numpy.log(counts[1:]))))
+    means = numpy.maximum(numpy.asarray(means, dtype=float), 1E-300)[..., None]
+    return numpy.exp(counts * numpy.log(means) - means - log_factorials)
+
+# Probability of being chosen as one of the witnesses of a commit round for an eligible identity with collateral, if
+# the number of other eligible identities with collateral is Poisson distributed with the given means
+# Witnesses are chosen uniformly among the eligible identities once there are enough of them
+def selection_probability(others, witnesses):
+    max_count = int(numpy.max(others) + 12 * math.sqrt(numpy.max(others)) + witnesses + 20)
+    counts = numpy.arange(max_count + 1)
+    chosen = numpy.where(counts + 1 >= witnesses, witnesses / (counts + 1), 0)
+    return poisson_pmf(others, max_count) @ chosen
+
+# Probability that at least the given number of witnesses is eligible and has collateral
+def success_probability(eligible, witnesses):
+    return 1 - poisson_pmf(eligible, witnesses - 1).sum(axis=-1)
+
+# Erlang B blocking probability of the given number of servers for every offered load
+# Loads are capped once blocking is negligible, blocking only decreases with more servers
+def erlang_b(servers, loads):
+    blocking = numpy.ones_like(loads)
+    max_servers = min(servers, int(numpy.max(loads, initial=0) + 12 * math.sqrt(numpy.max(loads, initial=0)) + 20))
+    for server in range(1, max_servers + 1):
+        blocking = loads * blocking / (server + loads * blocking)
+    return blocking
+
+# Data requests per epoch of a synthetic workload, blocks draw a normal number of data requests rounded and cut off at zero
+def synthetic_rate(avg_data_requests, std_data_requests):
+    if std_data_requests == 0:
+        return max(0.0, float(numpy.round(avg_data_requests)))
+    counts = numpy.arange(1, int(avg_data_requests + 10 * std_data_requests) + 2)
+    cdf = numpy.array([0.5 * (1 + math.erf((count - avg_data_requests) / (std_data_requests * math.sqrt(2)))) for count in numpy.append(counts - 0.5, counts[-1] + 0.5)])
+    return float((counts * numpy.diff(cdf)).sum())
+
+# Workload as a list of (data requests per epoch, witnesses, collateral) classes
+# A synthetic workload is one class, a workload read from files has one class per (witnesses, collateral) pair seen in
+# the epochs of the detailed phase
+def workload(options, data_requests=None):
+    if not options.data_requests_file:
+        return [(synthetic_rate(options.avg_data_requests, options.std_data_requests), options.witnesses, options.collateral)]
+
+    if data_requests is None:
+        data_requests = read_data_requests_files(options.data_requests_file)
+    first_epoch = options.offset_epochs + options.warmup_epochs
+    last_epoch = min(first_epoch + options.detailed_epochs, data_requests.max_epoch() + 1)
+    first, last = numpy.searchsorted(data_requests.epochs, [first_epoch, last_epoch]).tolist()
+    start, end = int(data_requests.offsets[first]), int(data_requests.offsets[last])
+    if end == start:
+        return []
+
+    pairs, counts = numpy.unique(numpy.stack((data_requests.witnesses[start:end], data_requests.collateral[start:end]), axis=1), axis=0, return_counts=True)
+    return [(count / (last_epoch - first_epoch), int(witnesses), float(collateral)) for (witnesses, collateral), count in zip(pairs.tolist(), counts.tolist())]
+
+# Mean-field estimate of the detailed phase of a simulation, from the eligibility of every reputation rank
+# Every identity is assumed to be eligible independently per commit round and to be available, i.e. to have enough
+# collateral, independently of the others, so the eligible identities with collateral are Poisson distributed
+# Per identity, the data requests it would be chosen for if it always had collateral arrive at a known rate and lock
+# collateral for collateral_locked epochs each, so by Little's law and the Erlang B formula for a loss system with one
+# server per collateral that fits in its balance, it lacks collateral a known fraction of the time
+# Availability and the rates depend on each other through the number of eligible identities, so they are iterated to
+# their fixed point
+# Returns the unsolved rate and the expected data requests solved and eligible but not solved per epoch and rank, and
+# the probability per rank of lacking collateral for the first class of the workload
+def estimate(ars, probabilities, workload_classes, balance, collateral_locked, approximate_eligibility, iterations=200, tolerance=1E-9):
+    identities = len(probabilities)
+    round_probabilities = [
+        [numpy.minimum(ars.eligibility_probabilities(probabilities, approximate_eligibility, witnesses, commit_round), 1) for commit_round in range(ars.commit_rounds)]
+        for rate, witnesses, collateral in workload_classes
+    ]
+
+    availability = numpy.ones((len(workload_classes), identities))
+    for iteration in range(iterations):
+        offered, no_collateral, unsolved = numpy.zeros((len(workload_classes), identities)), numpy.zeros((len(workload_classes), identities)), numpy.zeros(len(workload_classes))
+        for workload_class, (rate, witnesses, collateral) in enumerate(workload_classes):
+            reached = 1.0
+            for eligibility in round_probabilities[workload_class]:
+                eligible = eligibility * availability[workload_class]
+                mean = eligible.sum()
+
+                # The other eligible identities exclude the identity itself, interpolated as their mean only spans a small range
+                grid = numpy.linspace(max(mean - eligible.max(), 0), mean, 33)
+                offered[workload_class] += reached * eligibility * numpy.interp(mean - eligible, grid, selection_probability(grid, witnesses))
+                no_collateral[workload_class] += reached * eligibility * (1 - availability[workload_class])
+                reached *= 1 - success_probability(mean, witnesses)
+            unsolved[workload_class] = reached
+
+        # Collateral that would be locked on average without ever lacking it, in units of the collateral of every class
+        rates = numpy.array([rate for rate, witnesses, collateral in workload_classes])
+        collaterals = numpy.array([collateral for rate, witnesses, collateral in workload_classes])
+        locked = collateral_locked * (rates[:, None] * offered * collaterals[:, None]).sum(axis=0)
+        new_availability = numpy.array([1 - erlang_b(int(balance // collateral), locked / collateral) for collateral in collaterals.tolist()])
+
+        change = numpy.abs(new_availability - availability).max(initial=0)
+        availability = 0.5 * availability + 0.5 * new_availability
+        if change < tolerance:
+            break
+
+    rates = numpy.array([rate for rate, witnesses, collateral in workload_classes])
+    return {
+        "unsolved_rate": float((rates * unsolved).sum() / max(rates.sum(), 1E-300)),
+        "solved": (rates[:, None] * offered * availability).sum(axis=0),
+        "eligible_no_collateral": (rates[:, None] * no_collateral).sum(axis=0),
+        "unavailable": 1 - availability[0] if len(workload_classes) > 0 else numpy.zeros(identities),
+    }
+
+# The ARS is created like the simulation creates it, so a seeded estimate describes the same initial ARS
+def create_ARS(options):
+    ars_seed, workload_seed = simulator.seed_sequences(options)
+    return simulator.create_ARS(simulator.simulation_options(**dict(vars(options), log_stdout="critical", log_file="critical")), ars_seed)
+
+# Options which define the ARS an estimate is based on
+def ars_key(options):
+    return (options.ars_file, options.create_random_ars, options.identities, options.max_reputation, options.zero_reputation_ratio, options.seed)
+
+# Estimate the statistics of the detailed phase of the simulation configured by the options
+def estimate_statistics(options, data_requests=None, ars=None):
+    start = time.perf_counter()
+
+    if ars is None:
+        ars = create_ARS(options)
+    workload_classes = workload(options, data_requests)
+
+    estimates = estimate(ars, ars.calculate_eligibilities().probabilities, workload_classes, options.balance, options.collateral_locked, options.approximate_eligibility)
+    solved, eligible_no_collateral = estimates["solved"] * options.detailed_epochs, estimates["eligible_no_collateral"] * options.detailed_epochs
+
+    # The simulation averages over the identities that solved at least one data request or also were eligible without
+    # collateral at least once, which happens with Poisson probability
+    statistics = {
+        "data_requests_per_epoch": sum(rate for rate, witnesses, collateral in workload_classes),
+        "unsolved_rate": estimates["unsolved_rate"],
+        "avg_solved": float(solved.sum() / max((-numpy.expm1(-solved)).sum(), 1E-300)),
+        "avg_eligible_no_collateral": float(eligible_no_collateral.sum() / max((-numpy.expm1(-solved - eligible_no_collateral)).sum(), 1E-300)),
+        # Identities lacking collateral for more than 1% of the data requests they are eligible for
+        "starved_identities": int(numpy.count_nonzero(estimates["unavailable"] > 0.01)),
+    }
+    for cutoff in (100, 1000):
+        statistics[f"top_{cutoff}_solved"] = float(solved[:cutoff].mean())
+        statistics[f"top_{cutoff}_eligible_no_collateral"] = float(eligible_no_collateral[:cutoff].mean())
+    statistics["milliseconds"] = (time.perf_counter() - start) * 1000
+
+    return statistics
+
+def main():
+    start = time.perf_counter()
+
+    parser = optparse.OptionParser()
+
+    # Parameter grid like that of sweep.py, every combination is estimated
+    parser.add_option("--balances", type="string", dest="balances", default="100", help="Comma-separated balances of each ARS identity in WIT")
+    parser.add_option("--collateral-locked", type="string", dest="collateral_locked", default="1000", help="Comma-separated times in epochs collateral will be locked after being used")
+    parser.add_option("--avg-data-requests", type="string", dest="avg_data_requests", help="Comma-separated average numbers of data requests in a block of a synthetic workload")
+    parser.add_option("--data-requests-files", type="string", action="append", dest="data_requests_files", default=[], help="Data requests files of one workload, can be repeated")
+    parser.add_option("--seed", type="int", dest="seed", default=1, help="Seed of the random ARS the estimates are based on")
+
+    # Options shared by all configurations
+    parser.add_option("--simulator-options", type="string", dest="simulator_options", default="", help="Additional simulator options of every configuration, such as the ARS and the number of epochs")
+
+    # Screening options
+    parser.add_option("--max-unsolved-rate", type="float", dest="max_unsolved_rate", help="Prune configurations with a higher estimated fraction of unsolved data requests")
+    parser.add_option("--max-starved-identities", type="int", dest="max_starved_identities", help="Prune configurations with more identities estimated to lack collateral")
+    parser.add_option("--results-file", type="string", dest="results_file", default=os.path.join("results", "estimates.csv"), help="CSV file to write the estimates of all configurations to")
+
+    options, args = parser.parse_args()
+    options.seeds = str(options.seed)
+
+    runs = sweep.build_runs(options)
+
+    # Input files are read once and the ARS is created once per distinct set of ARS options
+    data_requests = {files: read_data_requests_files(files) for files in options.data_requests_files}
+    ars_cache = {}
+
+    rows = []
+    print(f"{'Configuration':<72}{'Requests/epoch':>16}{'Unsolved':>10}{'Solved':>10}{'No collateral':>15}{'Starved':>9}{'ms':>9}")
+    for name, configuration, argv in runs:
+        run_options, run_args = simulator.create_parser().parse_args(argv)
+        if ars_key(run_options) not in ars_cache:
+            ars_cache[ars_key(run_options)] = create_ARS(run_options)
+
+        statistics = estimate_statistics(run_options, data_requests.get(run_options.data_requests_file), ars_cache[ars_key(run_options)])
+        pruned = (options.max_unsolved_rate is not None and statistics["unsolved_rate"] > options.max_unsolved_rate) or (options.max_starved_identities is not None and statistics["starved_identities"] > options.max_starved_identities)
+        rows.append(dict(name=name, **configuration, **statistics, pruned=pruned, argv=shlex.join(argv)))
+
+        description = ", ".join(f"{key}={os.path.basename(str(value))}" for key, value in configuration.items() if key != "seed")
+        print(f"{description:<72}{statistics['data_requests_per_epoch']:>16.3f}{statistics['unsolved_rate']:>10.4f}{statistics['avg_solved']:>10.2f}{statistics['avg_eligible_no_collateral']:>15.2f}{statistics['starved_identities']:>9}{statistics['milliseconds']:>9.1f}{'  pruned' if pruned else ''}")
+
+    if os.path.dirname(options.results_file) and not os.path.exists(os.path.dirname(options.results_file)):
+        os.makedirs(os.path.dirname(options.results_file))
+    with open(options.results_file, "w", newline="") as f:
+        configuration_columns = list(dict.fromkeys(column for name, configuration, argv in runs for column in configuration))
+        writer = csv.DictWriter(f, fieldnames=["name"] + configuration_columns + ESTIMATE_COLUMNS + ["pruned", "argv"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+    kept = sum(not row["pruned"] for row in rows)
+    print(f"\n{kept} of {len(rows)} configurations kept, estimated in {time.perf_counter() - start:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
@@ -13,7 +13,14 @@ def open_file(filename):
 
     return f
 
-def open_stats_file():
+def open_stats_file(stats_file=None):
+    # Write to an explicit path, so concurrent simulations do not race for the same counter
+    if stats_file:
+        stats_dir = os.path.dirname(os.path.realpath(stats_file))
+        if not os.path.exists(stats_dir):
+            os.makedirs(stats_dir)
+        return open(stats_file, "w+")
+
     results_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "results")
     if not os.path.exists(results_dir):
         os.mkdir(results_dir)
@@ -1,91 +1,118 @@
-import random
+import logging
+import numpy
 import string
 
-from dataclasses import dataclass
-from dataclasses import field
+from logger import create_logger
 
-from typing import List
-from typing import Tuple
+IDENTITY_CHARACTERS = numpy.array(list(string.ascii_lowercase + string.digits))
 
-from logger import create_logger
+# Names of many identities drawn at once
+def generate_identities(rng, count):
+    characters = rng.choice(IDENTITY_CHARACTERS, (count, 38))
+    return ["wit1" + name for name in characters.view("<U38").ravel().tolist()]
 
-@dataclass
+# View on one identity of an ARSState, identities are added to the state in bulk by the ARS
+# Reputation, reputation gains, collateral and statistics all live in the index-aligned state arrays
 class Identity:
+    __slots__ = ("state", "index", "logger")
+
+    def __init__(self, state, index, logger=None):
+        self.state = state
+        self.index = index
+        self.logger = logger
+
+    def __repr__(self):
+        return f"Identity(name={self.name!r}, total_reputation={self.total_reputation}, reputation_gains={list(self.reputation_gains)}, available_collateral={self.available_collateral}, solved_data_requests={self.solved_data_requests}, eligible_no_collateral={self.eligible_no_collateral})"
+
     # Name
-    def generate_identity() -> str:
-        return "wit1" + "".join([random.choice(string.ascii_lowercase + string.digits) for n in range(38)])
-    name: str = field(default_factory=generate_identity)
+    @property
+    def name(self):
+        return self.state.names[self.index]
 
     # Reputation
-    total_reputation: int = 0
-    reputation_gains: List[Tuple[int, int]] = field(default_factory=lambda: []) # List of (expiry time, reputation amount) items
+    @property
+    def reputation_gains(self):
+        return self.state.reputation_gains.items(self.index)
+
+    @property
+    def total_reputation(self):
+        return int(self.state.total_reputation[self.index])
+
+    @total_reputation.setter
+    def total_reputation(self, total_reputation):
+        self.state.set_reputation(self.index, total_reputation)
 
     # Balance
-    available_collateral: List[Tuple[int, int]] = field(default_factory=lambda: []) # List of (collaterizable epoch, collateral amount) items
+    # The collaterizable balance is listed as one UTXO, followed by all locked UTXOs
+    @property
+    def collaterizable_balance(self):
+        return float(self.state.collaterizable_balance[self.index])
+
+    @property
+    def available_collateral(self):
+        unlocked = [(0, self.collaterizable_balance)] if self.collaterizable_balance > 0 else []
+        return unlocked + self.state.locked_collateral.items(self.index)
 
     # Statistics
-    solved_data_requests: int = 0
-    eligible_no_collateral: int = 0
+    @property
+    def solved_data_requests(self):
+        return int(self.state.solved_data_requests[self.index])
+
+    @solved_data_requests.setter
+    def solved_data_requests(self, solved_data_requests):
+        self.state.solved_data_requests[self.index] = solved_data_requests
 
-    # Logger
-    logger: str = None
+    @property
+    def eligible_no_collateral(self):
+        return int(self.state.eligible_no_collateral[self.index])
 
+    @eligible_no_collateral.setter
+    def eligible_no_collateral(self, eligible_no_collateral):
+        self.state.eligible_no_collateral[self.index] = eligible_no_collateral
+
+    # All UTXOs collaterizable at this epoch need to be released by the state beforehand
     def can_witness(self, epoch, required_collateral):
-        collaterizable_balance = sum([collateral[1] for collateral in self.available_collateral if collateral[0] <= epoch])
-        if collaterizable_balance >= required_collateral:
-            self.logger.debug(f"{self.name} can witness at epoch {epoch}")
+        if self.state.collaterizable_balance[self.index] >= required_collateral:
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("%s can witness at epoch %d", self.name, epoch)
             return True
 
-        self.logger.debug(f"{self.name} can witness at epoch {epoch} but does not have enough collateral: {self.available_collateral}")
-        self.eligible_no_collateral += 1
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("%s can witness at epoch %d but does not have enough collateral: %s", self.name, epoch, self.available_collateral)
+        self.state.eligible_no_collateral[self.index] += 1
 
         return False
 
     def mark_collateral(self, epoch, required_collateral, used_until):
-        assert self.can_witness(epoch, required_collateral)
-
-        counter, sum_collateral = 0, 0
-        while counter < len(self.available_collateral):
-            sum_collateral += self.available_collateral[counter][1]
-            current_collateral_age = self.available_collateral[counter][0]
-            if sum_collateral >= required_collateral:
-                # Remove current picked values
-                del self.available_collateral[0:counter+1]
-                # Add used collateral to the back of the list
-                self.available_collateral.append((used_until, required_collateral))
-                # Add the remainder back to the head of the list
-                if sum_collateral > required_collateral:
-                    self.available_collateral.insert(0, (current_collateral_age, sum_collateral - required_collateral))
-                self.logger.debug(f"{self.name} updated collateral UTXOs @ epoch {epoch}: {self.available_collateral}")
-                break
-            counter += 1
-
-        self.solved_data_requests += 1
+        assert self.state.collaterizable_balance[self.index] >= required_collateral
+
+        # Use collateral from the balance and lock it until it can be used again
+        self.state.collaterizable_balance[self.index] -= required_collateral
+        self.state.lock_collateral(self.index, used_until, required_collateral)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("%s updated collateral UTXOs @ epoch %d: %s", self.name, epoch, self.available_collateral)
+
+        self.state.solved_data_requests[self.index] += 1
 
     def update_reputation(self, reputation_expire, witnessing_acts, reputation, epoch):
-        if len(self.reputation_gains) > 0:
-            assert self.reputation_gains[0][0] >= witnessing_acts - reputation_expire
-        self.reputation_gains.append((witnessing_acts, reputation))
-        self.total_reputation = sum(reputation_gain[1] for reputation_gain in self.reputation_gains)
-        self.logger.debug(f"{self.name} gained new reputation @ epoch {epoch}, {witnessing_acts}: {self.reputation_gains}")
-        self.logger.debug(f"{self.name} new total reputation @ epoch {epoch}, {witnessing_acts}: {self.total_reputation}")
+        if self.state.reputation_gains.lengths[self.index] > 0:
+            assert self.state.reputation_gains.first_time(self.index) >= witnessing_acts - reputation_expire
+        self.state.gain_reputation(self.index, witnessing_acts, reputation)
+        self.total_reputation = self.total_reputation + reputation
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("%s gained new reputation @ epoch %d, %d: %s", self.name, epoch, witnessing_acts, self.reputation_gains)
+            self.logger.debug("%s new total reputation @ epoch %d, %d: %d", self.name, epoch, witnessing_acts, self.total_reputation)
 
     def get_expired_reputation(self, witness_acts_expired, epoch, total_witness_acts):
-        counter, reputation_expired = 0, 0
-        while counter < len(self.reputation_gains):
-            if self.reputation_gains[counter][0] < witness_acts_expired:
-                self.logger.debug(f"{self.name} reputation expired @ epoch {epoch}, {total_witness_acts} ({witness_acts_expired}): {self.reputation_gains[counter]}")
-                reputation_expired += self.reputation_gains[counter][1]
-            else:
-                break
-            counter += 1
-        del self.reputation_gains[0:counter]
-
-        self.total_reputation = sum(reputation_gain[1] for reputation_gain in self.reputation_gains)
-        self.logger.debug(f"{self.name} new total reputation @ epoch {epoch}: {self.total_reputation}")
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        reputation_expired = 0
+        for reputation_gain in self.state.expire_reputation(self.index, witness_acts_expired):
+            if debug:
+                self.logger.debug("%s reputation expired @ epoch %d, %d (%d): %s", self.name, epoch, total_witness_acts, witness_acts_expired, reputation_gain)
+            reputation_expired += reputation_gain[1]
 
-        return reputation_expired
+        self.total_reputation = self.total_reputation - reputation_expired
+        if debug:
+            self.logger.debug("%s new total reputation @ epoch %d: %d", self.name, epoch, self.total_reputation)
 
-    def clear_stats(self):
-        self.solved_data_requests = 0
-        self.eligible_no_collateral = 0
+        return reputation_expired
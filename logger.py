@@ -1,6 +1,12 @@
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
 
+# Background writers per (stdout level, file level, log file), shared by all loggers configured with them
+listeners = {}
+
 def get_logging_level(level):
     if level.lower() == "critical":
         return logging.CRITICAL
@@ -16,11 +22,8 @@ def get_logging_level(level):
         print("Invalid logging level!")
         sys.exit(1)
 
-def create_logger(name, stdout_level, file_level):
-    logger = logging.getLogger(name)
-
-    logger.setLevel(min(get_logging_level(stdout_level), get_logging_level(file_level)))
-
+# Records are handed to a queue and written to stdout and the log file by a background thread
+def start_listener(stdout_level, file_level, log_path):
     # create a logging format
     formatter = logging.Formatter('%(asctime)s - %(name)-10s - %(levelname)s - %(message)s')
 
@@ -28,12 +31,40 @@ def create_logger(name, stdout_level, file_level):
     consoleHandler = logging.StreamHandler(sys.stdout)
     consoleHandler.setLevel(get_logging_level(stdout_level))
     consoleHandler.setFormatter(formatter)
-    logger.addHandler(consoleHandler)
 
     # create a file logger
-    fileHandler = logging.FileHandler("simulation.log")
+    fileHandler = logging.FileHandler(log_path)
     fileHandler.setLevel(get_logging_level(file_level))
     fileHandler.setFormatter(formatter)
-    logger.addHandler(fileHandler)
+
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, consoleHandler, fileHandler, respect_handler_level=True)
+    listener.start()
+
+    return listener, logging.handlers.QueueHandler(records)
+
+def create_logger(name, stdout_level, file_level, log_path="simulation.log"):
+    logger = logging.getLogger(name)
+
+    logger.setLevel(min(get_logging_level(stdout_level), get_logging_level(file_level)))
+
+    key = (get_logging_level(stdout_level), get_logging_level(file_level), log_path)
+    if key not in listeners:
+        listeners[key] = start_listener(stdout_level, file_level, log_path)
+
+    # Replace the handler of an earlier call, so creating several ARS instances does not duplicate every record
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(listeners[key][1])
 
     return logger
+
+# Write all queued records and close the log files
+def stop_loggers():
+    for listener, queue_handler in listeners.values():
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+    listeners.clear()
+
+atexit.register(stop_loggers)
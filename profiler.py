@@ -0,0 +1,120 @@
+import collections
+import functools
+import inspect
+import time
+
+# Wall time and calls of sections of the simulation, a section is a timed function or a phase of the simulation
+# Sections are tracked as a stack, so the time of a section is split in the time spent in itself and in the sections
+# it called, and folded stacks of the self time can be written for flame graphs
+class Profiler:
+    def __init__(self):
+        self.stack = []
+        self.starts = []
+        self.child_ns = []
+
+        # Per (phase, section)
+        self.total_ns = collections.defaultdict(int)
+        self.self_ns = collections.defaultdict(int)
+        self.calls = collections.defaultdict(int)
+
+        # Self time per stack of sections
+        self.folded_ns = collections.defaultdict(int)
+
+        # Functions replaced by their timed version as (owner, attribute, original)
+        self.installed = []
+
+        self.overhead_ns = 0
+        self.overhead_ns = self.calibrate()
+
+    def enter(self, section):
+        self.stack.append(section)
+        self.child_ns.append(0)
+        self.starts.append(time.perf_counter_ns())
+
+    def exit(self):
+        elapsed = time.perf_counter_ns() - self.starts.pop()
+        child_ns = self.child_ns.pop()
+        key = (self.stack[0], self.stack[-1])
+        self.total_ns[key] += elapsed
+        self.self_ns[key] += elapsed - child_ns
+        self.calls[key] += 1
+        self.folded_ns[";".join(self.stack)] += elapsed - child_ns
+        self.stack.pop()
+        # The profiling overhead of a call is not counted as self time of its caller
+        if self.child_ns:
+            self.child_ns[-1] += elapsed + self.overhead_ns
+
+    # Time spent in enter and exit per timed call, which is only partly included in the time of the section itself
+    def calibrate(self, calls=10000):
+        start = time.perf_counter_ns()
+        for _ in range(calls):
+            self.enter("calibration")
+            self.exit()
+        overhead_ns = (time.perf_counter_ns() - start) // calls
+
+        self.total_ns.clear()
+        self.self_ns.clear()
+        self.calls.clear()
+        self.folded_ns.clear()
+
+        return overhead_ns
+
+    def timed(self, section, function):
+        # Generators are timed while producing every item, not while the consumer handles it
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def timed_generator(*args, **kwargs):
+                iterator = function(*args, **kwargs)
+                while True:
+                    self.enter(section)
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        self.exit()
+                    yield item
+            return timed_generator
+
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            self.enter(section)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.exit()
+        return timed_function
+
+    # Replace the functions given as (owner, attribute, section) by their timed version until uninstall
+    def install(self, functions):
+        for owner, attribute, section in functions:
+            original = getattr(owner, attribute)
+            self.installed.append((owner, attribute, original))
+            setattr(owner, attribute, self.timed(section, original))
+
+    def uninstall(self):
+        for owner, attribute, original in reversed(self.installed):
+            setattr(owner, attribute, original)
+        self.installed = []
+
+    def phases(self):
+        return list(dict.fromkeys(phase for phase, section in self.total_ns))
+
+    def write_profile(self, f_stats):
+        f_stats.write(f"Profile, {self.overhead_ns / 1000:.2f} us profiling overhead per timed call\n")
+        for phase in self.phases():
+            phase_ns = self.total_ns[(phase, phase)]
+            calls = sum(count for (call_phase, section), count in self.calls.items() if call_phase == phase) - 1
+            f_stats.write(f"\n{phase}: {phase_ns / 1E9:.2f} seconds, {calls} timed calls, {calls * self.overhead_ns / 1E9:.2f} seconds profiling overhead\n")
+            f_stats.write(f"{'Section':<40}{'Calls':>12}{'Total (s)':>12}{'Self (s)':>12}{'Self (%)':>10}{'Per call (us)':>15}\n")
+            sections = sorted((key for key in self.total_ns if key[0] == phase), key=lambda key: -self.self_ns[key])
+            for key in sections:
+                f_stats.write(f"{key[1]:<40}{self.calls[key]:>12}{self.total_ns[key] / 1E9:>12.3f}{self.self_ns[key] / 1E9:>12.3f}{self.self_ns[key] / max(phase_ns, 1) * 100:>10.2f}{self.total_ns[key] / self.calls[key] / 1000:>15.2f}\n")
+        f_stats.write("\n")
+
+    # Folded stacks with the self time in microseconds, the input format of flamegraph.pl and speedscope
+    def write_folded(self, path):
+        with open(path, "w") as f:
+            for stack, elapsed in sorted(self.folded_ns.items()):
+                if elapsed >= 1000:
+                    f.write(f"{stack} {elapsed // 1000}\n")
@@ -0,0 +1,133 @@
+import glob
+import hashlib
+import json
+import numpy
+import os
+import sqlite3
+import time
+
+from checkpoint import SIMULATION_OPTIONS
+from checkpoint import hash_options
+
+RESULT_CACHE_VERSION = 1
+
+# Options that determine the results of a simulation
+RESULT_OPTIONS = SIMULATION_OPTIONS + [
+    "stream_data_requests",
+    "replicas",
+]
+
+# Statistics stored as columns of their own so results can be queried directly, all statistics are also stored as JSON
+STATS_COLUMNS = [
+    "warmup_data_requests",
+    "detailed_data_requests",
+    "warmup_epochs",
+    "detailed_epochs",
+    "max_solved",
+    "max_eligible_no_collateral",
+    "avg_solved",
+    "avg_eligible_no_collateral",
+    "top_100_solved",
+    "top_100_eligible_no_collateral",
+    "top_1000_solved",
+    "top_1000_eligible_no_collateral",
+    "seconds",
+]
+
+# Modules which do not take part in a simulation, changing them does not invalidate cached results
+TOOL_MODULES = [
+    "benchmark.py",
+    "check_data_request_inputs.py",
+    "estimator.py",
+    "sweep.py",
+    "test.py",
+]
+
+def result_cache_path():
+    return os.path.join(os.path.dirname(os.path.realpath(__file__)), "results", "results.sqlite")
+
+# Hash of the source of all simulator modules, so results of older code are never returned
+def code_version():
+    code_hash = hashlib.sha256()
+    for module in sorted(glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), "*.py"))):
+        if os.path.basename(module) not in TOOL_MODULES:
+            with open(module, "rb") as f:
+                code_hash.update(f.read())
+    return code_hash.hexdigest()[:16]
+
+# Only simulations with a seed are reproducible, and the telemetry, profile and printed ARS of a simulation are not cached
+def cacheable(options):
+    return options.seed is not None and not options.telemetry_file and not options.profile and not options.print_ars
+
+def to_json(value):
+    if isinstance(value, dict):
+        return {name: to_json(item) for name, item in value.items()}
+    if isinstance(value, (numpy.ndarray, numpy.generic)):
+        return value.tolist()
+    return value
+
+# Result of a simulation read from the cache, the statistics are those of the simulation result
+class CachedResult:
+    def __init__(self, key, created, stats, intervals, text):
+        self.key = key
+        self.created = created
+        self.stats = {name: numpy.array(value) if isinstance(value, list) else value for name, value in stats.items()}
+        self.intervals = intervals
+        self.text = text
+        self.seconds = self.stats["seconds"]
+
+# Results of finished simulations in an SQLite database, keyed by a hash of the options that determine them, the content
+# of the input files and the code version
+# Every result is one row with the statistics as columns, the statistics file text and all options as JSON
+class ResultCache:
+    def __init__(self, path=None):
+        self.path = path if path is not None else result_cache_path()
+        if os.path.dirname(self.path) and not os.path.exists(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.code_version = code_version()
+
+        # Simulations running in parallel share the database, writers wait for each other
+        self.connection = sqlite3.connect(self.path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.execute(f"""CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                created TEXT,
+                code_version TEXT,
+                options TEXT,
+                {", ".join(f"{column} REAL" for column in STATS_COLUMNS)},
+                stats TEXT,
+                intervals TEXT,
+                text TEXT
+            )""")
+
+    def key(self, options):
+        key = hashlib.sha256(f"version={RESULT_CACHE_VERSION}\ncode={self.code_version}\noptions={hash_options(options, RESULT_OPTIONS)}\n".encode("utf-8"))
+        return key.hexdigest()[:16]
+
+    def lookup(self, options):
+        key = self.key(options)
+        row = self.connection.execute("SELECT created, stats, intervals, text FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        created, stats, intervals, text = row
+        return CachedResult(key, created, json.loads(stats), json.loads(intervals) if intervals else None, text)
+
+    # Store the statistics of a simulation and the text written to its statistics file after the options
+    def store(self, options, stats, text, intervals=None):
+        stats = to_json(stats)
+        row = [
+            self.key(options),
+            time.strftime("%Y-%m-%dT%H:%M:%S"),
+            self.code_version,
+            json.dumps({name: getattr(options, name) for name in RESULT_OPTIONS}),
+            *[stats.get(column) for column in STATS_COLUMNS],
+            json.dumps(stats),
+            json.dumps(to_json(intervals)) if intervals is not None else None,
+            text,
+        ]
+        with self.connection:
+            self.connection.execute(f"INSERT OR REPLACE INTO results VALUES ({', '.join('?' * len(row))})", row)
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,140 @@
+import atexit
+import numpy
+
+from multiprocessing import shared_memory
+
+from ARS import read_ars_file
+from checkpoint import hash_options
+
+# Options that determine the initial ARS of a simulation
+ARS_OPTIONS = [
+    "collateral_locked",
+    "identities",
+    "balance",
+    "create_random_ars",
+    "max_reputation",
+    "zero_reputation_ratio",
+    "ars_file",
+    "seed",
+    "replica",
+]
+
+# Arrays are aligned within a shared memory block like numpy aligns its own allocations
+ALIGNMENT = 64
+
+# Inputs shared by the parent process and attached by this worker process, ARS files by name and initial ARS
+# snapshots by ARS key
+attached = {"ars_files": {}, "ars": {}}
+# Shared memory blocks this process is attached to, they are closed once no array views them anymore
+attached_memory = []
+
+def ars_key(options):
+    return hash_options(options, ARS_OPTIONS)
+
+# Position of an array in a shared memory block
+class SharedArray:
+    def __init__(self, dtype, shape, offset):
+        self.dtype = dtype
+        self.shape = shape
+        self.offset = offset
+
+# Replace the arrays in a value of nested dictionaries by their position in a shared memory block, all other values are
+# kept as they are
+def layout(value, arrays, size=0):
+    if isinstance(value, dict):
+        shared = {}
+        for name, item in value.items():
+            shared[name], size = layout(item, arrays, size)
+        return shared, size
+    if isinstance(value, numpy.ndarray):
+        offset = -(-size // ALIGNMENT) * ALIGNMENT
+        arrays.append((offset, value))
+        return SharedArray(value.dtype.str, value.shape, offset), offset + value.nbytes
+    return value, size
+
+# Copy all arrays of a value into one shared memory block, returns the block and the layout to attach to it with
+def share(value):
+    arrays = []
+    shared, size = layout(value, arrays)
+    memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for offset, array in arrays:
+        numpy.ndarray(array.shape, array.dtype, memory.buf, offset)[...] = array
+    return memory, shared
+
+# Read-only views of the arrays of a value in a shared memory block
+def views(shared, memory):
+    if isinstance(shared, dict):
+        return {name: views(item, memory) for name, item in shared.items()}
+    if isinstance(shared, SharedArray):
+        array = numpy.ndarray(shared.shape, numpy.dtype(shared.dtype), memory.buf, shared.offset)
+        array.flags.writeable = False
+        return array
+    return shared
+
+# Inputs loaded once by a parent process for all its worker processes, the shared memory is released on close
+class SharedInputs:
+    def __init__(self):
+        self.memory = []
+        # Name of the shared memory block and layout of every input
+        self.inputs = {"ars_files": {}, "ars": {}}
+
+    def add(self, kind, key, value):
+        memory, shared = share(value)
+        self.memory.append(memory)
+        self.inputs[kind][key] = (memory.name, shared)
+
+    def share_ars_file(self, ars_file):
+        if ars_file not in self.inputs["ars_files"]:
+            names, reputations = read_ars_file(ars_file)
+            self.add("ars_files", ars_file, {"names": numpy.array(names), "reputations": reputations})
+
+    # The snapshot of an initial ARS is restored by all simulations with the same ARS key
+    def share_ars(self, key, snapshot):
+        self.add("ars", key, snapshot)
+
+    def close(self):
+        for memory in self.memory:
+            memory.close()
+            memory.unlink()
+        self.memory = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# Attach to the inputs shared by the parent process, used as the initializer of worker processes
+def attach(inputs):
+    detach()
+    for kind, shared_inputs in inputs.items():
+        for key, (name, shared) in shared_inputs.items():
+            memory = shared_memory.SharedMemory(name)
+            attached_memory.append(memory)
+            attached[kind][key] = views(shared, memory)
+
+def detach():
+    for shared_inputs in attached.values():
+        shared_inputs.clear()
+    while attached_memory:
+        memory = attached_memory.pop()
+        try:
+            memory.close()
+        except BufferError:
+            # An array still views the block, it is unmapped when the process exits
+            pass
+
+atexit.register(detach)
+
+# Names and reputations of an ARS file shared by the parent process, None if it was not shared
+def shared_ars_file(ars_file):
+    if ars_file not in attached["ars_files"]:
+        return None
+    shared = attached["ars_files"][ars_file]
+    return shared["names"].tolist(), shared["reputations"]
+
+# Snapshot of the initial ARS of a simulation shared by the parent process, None if it was not shared
+def shared_ars(options):
+    if len(attached["ars"]) == 0 or options.seed is None:
+        return None
+    return attached["ars"].get(ars_key(options))
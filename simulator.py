@@ -1,17 +1,45 @@
 #!/usr/bin/python3
 
 import bz2
+import copy
+import io
 import logging
 import numpy
+import multiprocessing
 import optparse
-import random
+import os
 import sys
 import time
 
 from ARS import ARS
-from file_manager import open_file
+from ARS import read_ars_file
+from ARS import write_stats
+from ars_state import ARSState
+from checkpoint import load_checkpoint
+from checkpoint import run_checkpoint_path
+from checkpoint import save_checkpoint
+from checkpoint import warmup_checkpoint_path
+from confidence import confidence_interval
+from convergence import ConvergenceMonitor
+from convergence import StationarityMonitor
+from data_requests import DataRequests
+from data_requests import DataRequestsStream
+from data_requests import read_data_requests_files
 from file_manager import open_stats_file
+from identity import Identity
 from logger import create_logger
+from logger import stop_loggers
+from profiler import Profiler
+from result_cache import ResultCache
+from result_cache import cacheable
+from shared_inputs import SharedInputs
+from shared_inputs import ars_key
+from shared_inputs import attach
+from shared_inputs import shared_ars
+from shared_inputs import shared_ars_file
+from telemetry import Telemetry
+
+PHASES = ["Warmup", "Detailed"]
 
 def dump_options(options, f_stats):
     f_stats.write(f"collateral-locked: {options.collateral_locked}\n")
@@ -34,65 +62,125 @@ def dump_options(options, f_stats):
         f_stats.write(f"collateral: {options.collateral}\n")
     else:
         f_stats.write(f"data-requests-file: {options.data_requests_file}\n")
+        f_stats.write(f"stream-data-requests: {'true' if options.stream_data_requests else 'false'}\n")
 
     f_stats.write(f"offset-epochs: {options.offset_epochs}\n")
     f_stats.write(f"warmup-epochs: {options.warmup_epochs}\n")
     f_stats.write(f"simulation-epochs: {options.detailed_epochs}\n")
 
     f_stats.write(f"approximate-eligibility: {'true' if options.approximate_eligibility else 'false'}\n")
+    f_stats.write(f"batch-data-requests: {'true' if options.batch_data_requests else 'false'}\n")
+    f_stats.write(f"target-precision: {options.target_precision}\n")
+    f_stats.write(f"warmup-stationarity: {options.warmup_stationarity}\n")
+    f_stats.write(f"batch-epochs: {options.batch_epochs}\n")
+    f_stats.write(f"min-batches: {options.min_batches}\n")
 
     f_stats.write(f"log-stdout: {options.log_stdout}\n")
     f_stats.write(f"log-file: {options.log_file}\n")
-
+    f_stats.write(f"log-path: {options.log_path}\n")
+    f_stats.write(f"telemetry-file: {options.telemetry_file}\n")
+    f_stats.write(f"profile: {'true' if options.profile else 'false'}\n")
+    f_stats.write(f"profile-folded: {options.profile_folded}\n")
+    f_stats.write(f"seed: {options.seed}\n")
+    f_stats.write(f"replicas: {options.replicas}\n")
+    f_stats.write(f"common-random-numbers: {'true' if options.common_random_numbers else 'false'}\n")
+    if options.replica is not None:
+        f_stats.write(f"replica: {options.replica}\n")
+
+    f_stats.write(f"shared-inputs: {'true' if options.shared_inputs else 'false'}\n")
     f_stats.write(f"print-ars: {'true' if options.print_ars else 'false'}\n")
 
-    f_stats.write("\n===================================================================\n\n")
-    f_stats.flush()
+    f_stats.write(f"warmup-checkpoint: {'true' if options.warmup_checkpoint else 'false'}\n")
+    f_stats.write(f"checkpoint-epochs: {options.checkpoint_epochs}\n")
+    f_stats.write(f"resume: {'true' if options.resume else 'false'}\n")
 
-def read_data_requests_files(data_requests_files):
-    data_requests = {}
+    f_stats.write(f"result-cache: {options.result_cache}\n")
+    f_stats.write(f"force: {'true' if options.force else 'false'}\n")
 
-    f = open_file(data_requests_files.split(",")[0])
-    first_epoch = int(f.readline().split(",")[0])
-    f.close()
-
-    for data_requests_file in data_requests_files.split(","):
-        f = open_file(data_requests_file)
-        for line in f:
-            # Read and transform CSV data
-            epoch, data_request_hash, witnesses, collateral = line.split(",")
-            epoch, witnesses, collateral = int(epoch), int(witnesses), int(collateral) / 1E9
+    f_stats.write("\n===================================================================\n\n")
+    f_stats.flush()
 
-            # Normalize epoch
-            epoch -= first_epoch
-            assert epoch >= 0, "Are the supplied data requests files in chronological order?"
+def generate_blocks(avg_data_requests, std_data_requests, epochs, rng):
+    return numpy.maximum(0, numpy.round(rng.normal(avg_data_requests, std_data_requests, epochs))).astype(numpy.int64)
+
+# Yield (epoch, data requests) for all epochs in [first_epoch, last_epoch) where a synthetic block contains data requests
+# Block sizes are generated in chunks of epochs so empty blocks can be skipped without visiting them
+# Every chunk has its own stream spawned from the workload seed, so the blocks of an epoch do not depend on the epoch
+# the phase started at, which changes when a phase ends early or a simulation is resumed
+def generate_data_request_events(options, first_epoch, last_epoch, seed_sequence, chunk_epochs=4096):
+    for chunk_start in range(first_epoch - first_epoch % chunk_epochs, last_epoch, chunk_epochs):
+        rng = numpy.random.default_rng(numpy.random.SeedSequence(seed_sequence.entropy, spawn_key=seed_sequence.spawn_key + (chunk_start // chunk_epochs,)))
+        num_data_requests = generate_blocks(options.avg_data_requests, options.std_data_requests, chunk_epochs, rng)
+        for offset in numpy.flatnonzero(num_data_requests).tolist():
+            if first_epoch <= chunk_start + offset < last_epoch:
+                yield chunk_start + offset, [[options.witnesses, options.collateral]] * int(num_data_requests[offset])
+
+# Simulate all blocks of one phase, jumping directly from one epoch with data requests to the next
+# Collateral unlocks and reputation expiry are only observed when witnesses are selected, so they are applied lazily
+# by the next simulated block and empty epochs only need to be counted
+# A phase resumed from a checkpoint continues from the histogram and total of data requests simulated before it was saved
+# The monitor is asked before every block whether the phase can end early, the phase then ends before that block
+# Returns the epoch the phase ended at besides the histogram, total and leftover reputation
+def simulate_phase(logger, mode, ars, events, first_epoch, last_epoch, options, leftover_reputation, data_request_hist=None, total_data_requests=0, checkpoint=None, monitor=None, telemetry=None):
+    if data_request_hist is None:
+        data_request_hist = {}
+    for epoch, data_requests in events:
+        if checkpoint is not None:
+            checkpoint(epoch, data_request_hist, total_data_requests, leftover_reputation)
+
+        if monitor is not None and monitor(epoch, data_requests, total_data_requests):
+            last_epoch = epoch
+            break
+
+        if len(data_requests) not in data_request_hist:
+            data_request_hist[len(data_requests)] = 1
+        else:
+            data_request_hist[len(data_requests)] += 1
+        total_data_requests += len(data_requests)
+
+        leftover_reputation = simulate_block(
+            logger,
+            mode,
+            ars,
+            epoch,
+            data_requests,
+            options.approximate_eligibility,
+            options.batch_data_requests,
+            leftover_reputation,
+            telemetry,
+        )
 
-            # Add to the dictionary
-            if epoch not in data_requests:
-                data_requests[epoch] = []
-            data_requests[epoch].append((witnesses, collateral))
-        f.close()
+    empty_epochs = (last_epoch - first_epoch) - sum(count for num, count in data_request_hist.items() if num != 0)
+    if empty_epochs > 0:
+        data_request_hist[0] = empty_epochs
+    logger.info(f"{mode}, skipped {empty_epochs} epochs without data requests")
 
-    return data_requests
+    return data_request_hist, total_data_requests, leftover_reputation, last_epoch
 
-def generate_block(avg_data_requests, std_data_requests):
-    return max(0, round(random.gauss(avg_data_requests, std_data_requests)))
+def simulate_block(logger, mode, ars, epoch, data_requests, approximate_eligibility, batch_data_requests, leftover_reputation, telemetry=None):
+    if telemetry is not None:
+        counters = ars.counters()
 
-def simulate_block(logger, mode, ars, epoch, data_requests, approximate_eligibility, leftover_reputation):
     # All reputation gained
     all_witnesses = []
     witnessing_acts = 0
     eligibilities = ars.calculate_eligibilities()
+    if batch_data_requests:
+        batch_results = ars.select_witnesses_batch(eligibilities, approximate_eligibility, data_requests, epoch)
     for data_request, (witnesses, collateral) in enumerate(data_requests):
-        logger.info(f"{mode}, epoch {epoch}, data request {data_request + 1}")
+        logger.info("%s, epoch %d, data request %d", mode, epoch, data_request + 1)
 
-        success, data_request_witnesses, insufficient_collateral_witnesses = ars.select_witnesses(eligibilities, approximate_eligibility, witnesses, epoch, collateral)
+        if batch_data_requests:
+            success, data_request_witnesses, insufficient_collateral_witnesses = batch_results[data_request]
+        else:
+            success, data_request_witnesses, insufficient_collateral_witnesses = ars.select_witnesses(eligibilities, approximate_eligibility, witnesses, epoch, collateral, data_request=data_request)
         if success:
             all_witnesses.extend(list(data_request_witnesses))
             witnessing_acts += len(data_request_witnesses)
         else:
-            logger.warning(f"Could not solve data request, only {len(data_request_witnesses)} witnesses found, {len(insufficient_collateral_witnesses)} witnesses had insufficient available collateral")
+            logger.warning("Could not solve data request, only %d witnesses found, %d witnesses had insufficient available collateral", len(data_request_witnesses), len(insufficient_collateral_witnesses))
 
+    created_reputation, expired_reputation = 0, 0
     if witnessing_acts > 0:
         created_reputation = ars.get_ARS_created_reputation(witnessing_acts, epoch)
         expired_reputation = ars.get_ARS_expired_reputation(witnessing_acts, epoch)
@@ -102,11 +190,103 @@ def simulate_block(logger, mode, ars, epoch, data_requests, approximate_eligibil
             epoch
         )
 
-    return leftover_reputation
+    # The active identities of the ranking are only updated by the next block, so count them after this block's update
+    if telemetry is not None:
+        active_identities = int(numpy.count_nonzero(ars.state.total_reputation[:len(ars.state)]))
+        telemetry.record(epoch, len(data_requests), counters, ars.counters(), created_reputation, expired_reputation, leftover_reputation, active_identities)
 
-def main():
-    start = time.perf_counter()
+    return leftover_reputation
 
+# Outcome of one simulation, the ARS statistics cover the detailed phase
+class SimulationResult:
+    def __init__(self, options, ars, data_request_hists, total_data_requests, epochs, seconds):
+        self.options = options
+        self.ars = ars
+        self.seconds = seconds
+
+        # Epochs actually simulated per phase, fewer than requested if a phase converged early
+        self.warmup_epochs, self.detailed_epochs = epochs
+
+        # Number of blocks per number of data requests they contain
+        self.warmup_data_request_hist, self.detailed_data_request_hist = [
+            numpy.bincount(list(data_request_hist.keys()), weights=list(data_request_hist.values())).astype(numpy.int64) if data_request_hist else numpy.zeros(0, dtype=numpy.int64)
+            for data_request_hist in data_request_hists
+        ]
+        self.total_warmup_data_requests, self.total_detailed_data_requests = total_data_requests
+
+        # Per identity counters, aligned with the names
+        self.names = list(ars.state.names)
+        self.total_reputation = ars.state.total_reputation.copy()
+        self.solved_data_requests = ars.state.solved_data_requests.copy()
+        self.eligible_no_collateral = ars.state.eligible_no_collateral.copy()
+
+        self.stats = ars.calculate_stats()
+        self.stats["warmup_data_requests"] = self.total_warmup_data_requests
+        self.stats["detailed_data_requests"] = self.total_detailed_data_requests
+        self.stats["warmup_epochs"] = self.warmup_epochs
+        self.stats["detailed_epochs"] = self.detailed_epochs
+        self.stats["seconds"] = seconds
+
+        # Profiler of the simulation if it was profiled
+        self.profile = None
+
+# Independent streams for the ARS and the synthetic workload, replicas use the streams spawned from the seed for them
+def seed_sequences(options):
+    seed_sequence = numpy.random.SeedSequence(options.seed, spawn_key=() if options.replica is None else (options.replica,))
+    return seed_sequence.spawn(2)
+
+def create_ARS(options, seed=None):
+    ars = ARS(options.log_stdout, options.log_file, options.collateral_locked, options.log_path, seed)
+    # Restore the initial ARS or read the ARS file shared by the parent process instead of creating or reading it again
+    snapshot = shared_ars(options)
+    if snapshot is not None:
+        ars.restore(snapshot)
+    elif options.create_random_ars:
+        ars.initialize_random_ARS(
+            options.identities,
+            options.max_reputation,
+            options.zero_reputation_ratio,
+            options.balance,
+        )
+    elif options.ars_file:
+        ars.initialize_ARS_from_reputations(
+            *(shared_ars_file(options.ars_file) or read_ars_file(options.ars_file)),
+            options.balance,
+        )
+    else:
+        ars.initialize_zero_reputation_ARS(
+            options.identities,
+            options.balance,
+        )
+    return ars
+
+# Load the inputs of simulations run by worker processes once into shared memory: every ARS file, and the initial ARS
+# of seeded simulations which start from the same ARS
+def share_inputs(options_list):
+    shared = SharedInputs()
+    try:
+        ars_options = {}
+        for options in options_list:
+            if options.ars_file and not options.create_random_ars:
+                shared.share_ars_file(options.ars_file)
+            if options.seed is not None:
+                ars_options.setdefault(ars_key(options), []).append(options)
+
+        # An initial ARS used by a single simulation is cheaper to create in its worker than to share
+        for key, same_ars_options in ars_options.items():
+            if len(same_ars_options) > 1:
+                options = copy.copy(same_ars_options[0])
+                options.log_stdout, options.log_file, options.log_path = "critical", "critical", os.devnull
+                ars_seed, workload_seed = seed_sequences(options)
+                shared.share_ars(key, create_ARS(options, ars_seed).snapshot())
+        stop_loggers()
+    except BaseException:
+        shared.close()
+        raise
+
+    return shared
+
+def create_parser():
     parser = optparse.OptionParser()
 
     # Configurable consensus constants
@@ -130,188 +310,393 @@ def main():
     # Options to create a simulation based on the actual network
     parser.add_option("--ars-file", type="string", dest="ars_file", help="Read and build ARS based on a file")
     parser.add_option("--data-requests-file", type="string", dest="data_requests_file", help="Read and simulate data requests from a file")
+    parser.add_option("--stream-data-requests", action="store_true", dest="stream_data_requests", default=False, help="Stream data requests from the input files instead of reading them through the binary cache")
 
     # Simulation parameters
     parser.add_option("--offset-epochs", type="int", dest="offset_epochs", default=0, help="Epoch offset for when to start the simulation")
     parser.add_option("--warmup-epochs", type="int", dest="warmup_epochs", default=0, help="Number of epochs for which to warmup the ARS")
     parser.add_option("--simulation-epochs", type="int", dest="detailed_epochs", default=1000, help="Number of epochs for which the ARS simulation runs")
     parser.add_option("--approximate-eligibility", action="store_true", dest="approximate_eligibility", default=False, help="Speed up simulation by approximating data request solving eligibility")
+    parser.add_option("--batch-data-requests", action="store_true", dest="batch_data_requests", default=False, help="Draw eligibility for all data requests in a block at once")
+
+    # Convergence options, the number of simulation epochs and warmup epochs become upper bounds
+    parser.add_option("--target-precision", type="float", dest="target_precision", help="End the detailed phase once the 95% confidence intervals of its statistics are within this fraction of their value")
+    parser.add_option("--warmup-stationarity", type="float", dest="warmup_stationarity", help="End the warmup once the reputation distribution changes less than this fraction between batches")
+    parser.add_option("--batch-epochs", type="int", dest="batch_epochs", default=1000, help="Number of epochs per batch of the convergence statistics")
+    parser.add_option("--min-batches", type="int", dest="min_batches", default=10, help="Minimum number of batches before a phase can end early")
 
     # Simulator options
     parser.add_option("--log-stdout", type="string", dest="log_stdout", default="info", help="Set logging level to stdout")
     parser.add_option("--log-file", type="string", dest="log_file", default="info", help="Set logging level to file")
+    parser.add_option("--log-path", type="string", dest="log_path", default="simulation.log", help="File to write the simulation log to")
+    parser.add_option("--telemetry-file", type="string", dest="telemetry_file", help="Record counters of every simulated block to this compressed columnar file")
+    parser.add_option("--profile", action="store_true", dest="profile", default=False, help="Time the sections of the simulation loop and write a breakdown to the statistics")
+    parser.add_option("--profile-folded", type="string", dest="profile_folded", help="With --profile, write the folded stacks of the profile to this file for flame graphs")
+    parser.add_option("--stats-file", type="string", dest="stats_file", help="File to write the statistics to instead of the next results/sim.stats.N")
+    parser.add_option("--seed", type="int", dest="seed", help="Seed for all random number generators to make the simulation reproducible")
+    parser.add_option("--replicas", type="int", dest="replicas", default=1, help="Number of independent replicas to simulate in parallel, statistics are reported with 95% confidence intervals")
+    parser.add_option("--replica", type="int", dest="replica", help="Only simulate this replica of the seed")
+    parser.add_option("--common-random-numbers", action="store_true", dest="common_random_numbers", default=False, help="Draw eligibility and witness selection from random numbers per epoch, data request and identity shared by all simulations with the same seed")
+    parser.add_option("--shared-inputs", action="store_true", dest="shared_inputs", default=False, help="Read the ARS file once and share it with the processes simulating the replicas")
     parser.add_option("--print-ars", action="store_true", dest="print_ars", default=False, help="At the end of the simulation, print all identities in the ARS")
 
-    options, args = parser.parse_args()
+    # Checkpoint options
+    parser.add_option("--warmup-checkpoint", action="store_true", dest="warmup_checkpoint", default=False, help="Restore the ARS after warmup from a checkpoint or save it for later runs with the same warmup options")
+    parser.add_option("--checkpoint-epochs", type="int", dest="checkpoint_epochs", default=0, help="Save a checkpoint of the simulation every this many epochs")
+    parser.add_option("--resume", action="store_true", dest="resume", default=False, help="Resume the simulation from its last checkpoint")
+
+    # Result cache options
+    parser.add_option("--result-cache", type="string", dest="result_cache", help="SQLite database of finished seeded simulations, results/results.sqlite by default")
+    parser.add_option("--no-result-cache", action="store_false", dest="use_result_cache", default=True, help="Neither look up nor store the result of this simulation")
+    parser.add_option("--force", action="store_true", dest="force", default=False, help="Simulate even if the result cache has a result for this configuration and replace it")
+
+    return parser
+
+# Options for a simulation driven from Python, options which are not given keep their command line default
+def simulation_options(**kwargs):
+    options = create_parser().get_default_values()
+    for name, value in kwargs.items():
+        assert hasattr(options, name), f"Unknown simulation option {name}"
+        setattr(options, name, value)
+    return options
+
+# Functions timed by the profiler as (owner, attribute, section)
+def profiled_functions():
+    simulator = sys.modules[__name__]
+    return [
+        (simulator, "create_ARS", "create_ARS"),
+        (simulator, "read_data_requests_files", "read_data_requests_files"),
+        (DataRequests, "events", "data_requests"),
+        (DataRequestsStream, "events", "data_requests"),
+        (simulator, "generate_data_request_events", "data_requests"),
+        (simulator, "simulate_block", "simulate_block"),
+        (ARS, "calculate_eligibilities", "calculate_eligibilities"),
+        (ARS, "select_witnesses_batch", "select_witnesses_batch"),
+        (ARS, "draw_first_round_eligible_ranks", "draw_eligible_ranks"),
+        (ARS, "select_witnesses", "select_witnesses"),
+        (ARS, "draw_eligible_ranks", "draw_eligible_ranks"),
+        (ARS, "draw_common_eligible_ranks", "draw_eligible_ranks"),
+        (ARSState, "unlock_collateral", "unlock_collateral"),
+        (Identity, "can_witness", "can_witness"),
+        (Identity, "mark_collateral", "mark_collateral"),
+        (ARS, "get_ARS_created_reputation", "get_ARS_created_reputation"),
+        (ARS, "get_ARS_expired_reputation", "get_ARS_expired_reputation"),
+        (ARS, "update_ARS_reputation", "update_ARS_reputation"),
+        (Telemetry, "record", "telemetry"),
+        (simulator, "save_checkpoint", "save_checkpoint"),
+        (logging.Logger, "debug", "logging"),
+        (logging.Logger, "info", "logging"),
+        (logging.Logger, "warning", "logging"),
+    ]
+
+# Run a complete simulation
+# Data requests already read by an earlier run can be passed in, they are only read from the input files otherwise
+# The simulation starts from the given ARS, which is modified in place, or from an ARS snapshot if one is given
+def run_simulation(options, ars=None, snapshot=None, data_requests=None):
+    if not options.profile:
+        return simulate(options, ars, snapshot, data_requests)
+
+    # The timed functions replace the originals for the duration of the simulation only
+    profiler = Profiler()
+    profiler.install(profiled_functions())
+    try:
+        result = simulate(options, ars, snapshot, data_requests, profiler)
+    finally:
+        profiler.uninstall()
+
+    result.profile = profiler
+    if options.profile_folded:
+        profiler.write_folded(options.profile_folded)
+
+    return result
+
+def simulate(options, ars=None, snapshot=None, data_requests=None, profiler=None):
+    start = time.perf_counter()
 
-    f_stats = open_stats_file()
+    # Reading the inputs and creating the ARS are profiled as a phase of their own
+    if profiler is not None:
+        profiler.enter("Setup")
 
-    dump_options(options, f_stats)
+    logger = create_logger("simulator", options.log_stdout, options.log_file, options.log_path)
 
-    logger = create_logger("simulator", options.log_stdout, options.log_file)
+    ars_seed, workload_seed = seed_sequences(options)
 
-    if options.create_random_ars:
-        ars = ARS(options.log_stdout, options.log_file, options.collateral_locked)
-        ars.initialize_random_ARS(
-            options.identities,
-            options.max_reputation,
-            options.zero_reputation_ratio,
-            options.balance,
-        )
-    elif options.ars_file:
-        ars = ARS(options.log_stdout, options.log_file, options.collateral_locked)
-        ars.initialize_ARS_from_file(
-            options.ars_file,
-            options.balance,
-        )
-        if options.warmup_epochs < options.collateral_locked:
-            print(f"You should warmup the simulation for at least {options.collateral_locked} epochs to make sure the collateral and reputation expiry lists contain reasonable values.")
-    else:
-        ars = ARS(options.log_stdout, options.log_file, options.collateral_locked)
-        ars.initialize_zero_reputation_ARS(
-            options.identities,
-            options.balance,
-        )
+    if data_requests is None and options.data_requests_file and options.stream_data_requests:
+        data_requests = DataRequestsStream(options.data_requests_file)
+    elif data_requests is None and options.data_requests_file:
+        data_requests = read_data_requests_files(options.data_requests_file)
 
-    data_requests_per_epoch = {}
-    if options.data_requests_file:
-        data_requests_per_epoch = read_data_requests_files(options.data_requests_file)
-
-        max_epochs = max(data_requests_per_epoch.keys())
+        max_epochs = data_requests.max_epoch()
         logger.info(f"Read data requests from input files for simulating {max_epochs} epochs")
         if max_epochs < options.offset_epochs + options.warmup_epochs + options.detailed_epochs:
             logger.warning(f"Too few epochs {max_epochs} read from input files to complete simulation")
 
-    # Run a warmup phase in the simulation
-    warmup_data_request_hist = {}
-    total_warmup_data_requests, leftover_reputation = 0, 0
-    for epoch in range(options.offset_epochs, options.offset_epochs + options.warmup_epochs):
-        if data_requests_per_epoch == {}:
-            num_data_requests = generate_block(options.avg_data_requests, options.std_data_requests)
-            data_requests = [[options.witnesses, options.collateral]] * num_data_requests
-
-            if num_data_requests not in warmup_data_request_hist:
-                warmup_data_request_hist[num_data_requests] = 1
-            else:
-                warmup_data_request_hist[num_data_requests] += 1
-            total_warmup_data_requests += num_data_requests
-
-            leftover_reputation = simulate_block(
-                logger,
-                "Warmup",
-                ars,
-                epoch,
-                data_requests,
-                options.approximate_eligibility,
-                leftover_reputation,
-            )
+    # Progress of the simulation, saved in a checkpoint together with the complete ARS state
+    simulation = {
+        "phase": 0,
+        "epoch": options.offset_epochs,
+        "data_request_hists": [{}, {}],
+        "total_data_requests": [0, 0],
+        "leftover_reputation": 0,
+        # Epochs simulated per phase, the detailed phase starts where the warmup ended
+        "epochs": [None, None],
+        # Convergence monitors per phase, if enabled
+        "monitors": [None, None],
+        # Telemetry chunks written up to the checkpoint
+        "telemetry_chunks": 0,
+    }
+
+    telemetry_chunks = 0
+    run_checkpoint = run_checkpoint_path(options) if options.resume or options.checkpoint_epochs > 0 else None
+    warmup_checkpoint = warmup_checkpoint_path(options) if options.warmup_checkpoint else None
+    # An ARS or snapshot passed in takes precedence over the checkpoints
+    if snapshot is not None:
+        ars = ARS(options.log_stdout, options.log_file, snapshot["collateral_locked"], options.log_path)
+        ars.restore(snapshot)
+    elif ars is None and options.resume and os.path.exists(run_checkpoint):
+        ars, simulation = load_checkpoint(run_checkpoint, options.log_stdout, options.log_file, options.log_path)
+        telemetry_chunks = simulation["telemetry_chunks"]
+        logger.info(f"Resuming {PHASES[simulation['phase']].lower()} phase at epoch {simulation['epoch']} from {run_checkpoint}")
+    elif ars is None and warmup_checkpoint and os.path.exists(warmup_checkpoint):
+        ars, simulation = load_checkpoint(warmup_checkpoint, options.log_stdout, options.log_file, options.log_path)
+        logger.info(f"Skipping warmup phase, restored ARS from {warmup_checkpoint}")
+    elif ars is None:
+        ars = create_ARS(options, ars_seed)
+        if options.ars_file and not options.create_random_ars and options.warmup_epochs < options.collateral_locked:
+            print(f"You should warmup the simulation for at least {options.collateral_locked} epochs to make sure the collateral and reputation expiry lists contain reasonable values.")
+
+    # Only a resumed simulation continues an existing telemetry file
+    telemetry = None
+    if options.telemetry_file:
+        telemetry = Telemetry(options.telemetry_file, chunks=telemetry_chunks)
+
+    # Configurations compared with common random numbers share the initial ARS and workload through the seed as well
+    if options.common_random_numbers:
+        assert options.seed is not None, "Common random numbers require a seed"
+        ars.common_random_numbers = (options.seed, 0 if options.replica is None else options.replica + 1)
+
+    if profiler is not None:
+        profiler.exit()
+
+    for phase in range(simulation["phase"], len(PHASES)):
+        mode = PHASES[phase]
+        if phase == 0:
+            phase_epoch, last_epoch = options.offset_epochs, options.offset_epochs + options.warmup_epochs
         else:
-            if epoch in data_requests_per_epoch:
-                if len(data_requests_per_epoch[epoch]) not in warmup_data_request_hist:
-                    warmup_data_request_hist[len(data_requests_per_epoch[epoch])] = 1
-                else:
-                    warmup_data_request_hist[len(data_requests_per_epoch[epoch])] += 1
-                total_warmup_data_requests += len(data_requests_per_epoch[epoch])
-
-                leftover_reputation = simulate_block(
-                    logger,
-                    "Warmup",
-                    ars,
-                    epoch,
-                    data_requests_per_epoch[epoch],
-                    options.approximate_eligibility,
-                    leftover_reputation,
-                )
-            else:
-                if 0 not in warmup_data_request_hist:
-                    warmup_data_request_hist[0] = 1
-                else:
-                    warmup_data_request_hist[0] += 1
-                logger.info(f"Warmup, epoch {epoch}, 0 data requests")
-
-    if options.warmup_epochs > 0:
-        # assert that the reputation statistics make sense
-        for identity in ars.identities.values():
-            assert identity.total_reputation == sum(reputation[1] for reputation in identity.reputation_gains)
-
-        if options.print_ars:
-            ars.print_ARS()
-
-    if options.detailed_epochs > 0:
-        ars.clear_stats()
-
-    # Run the actual simulation
-    detailed_data_request_hist = {}
-    total_detailed_data_requests, leftover_reputation = 0, 0
-    epochs_before = options.offset_epochs + options.warmup_epochs
-    for epoch in range(epochs_before, epochs_before + options.detailed_epochs):
-        if data_requests_per_epoch == {}:
-            num_data_requests = generate_block(options.avg_data_requests, options.std_data_requests)
-            data_requests = [[options.witnesses, options.collateral]] * num_data_requests
-
-            if num_data_requests not in detailed_data_request_hist:
-                detailed_data_request_hist[num_data_requests] = 1
-            else:
-                detailed_data_request_hist[num_data_requests] += 1
-            total_detailed_data_requests += num_data_requests
-
-            leftover_reputation= simulate_block(
-                logger,
-                "Detailed",
-                ars,
-                epoch,
-                data_requests,
-                options.approximate_eligibility,
-                leftover_reputation,
-            )
+            phase_epoch = options.offset_epochs + simulation["epochs"][0]
+            last_epoch = phase_epoch + options.detailed_epochs
+
+        if simulation["epoch"] <= phase_epoch and phase == 1 and options.detailed_epochs > 0:
+            ars.clear_stats()
+        first_epoch = max(phase_epoch, simulation["epoch"])
+
+        # Save the simulation progress before simulating the first block at or past every multiple of checkpoint-epochs
+        checkpoint = None
+        if options.checkpoint_epochs > 0:
+            next_checkpoint = [(first_epoch // options.checkpoint_epochs + 1) * options.checkpoint_epochs]
+            def checkpoint(epoch, data_request_hist, total_data_requests, leftover_reputation, phase=phase):
+                if epoch < next_checkpoint[0]:
+                    return
+                simulation["phase"], simulation["epoch"] = phase, epoch
+                simulation["data_request_hists"][phase] = dict(data_request_hist)
+                simulation["total_data_requests"][phase] = total_data_requests
+                simulation["leftover_reputation"] = leftover_reputation
+                if telemetry is not None:
+                    telemetry.flush()
+                    simulation["telemetry_chunks"] = telemetry.chunks
+                save_checkpoint(run_checkpoint, ars, simulation)
+                logger.info(f"{mode}, saved checkpoint at epoch {epoch} to {run_checkpoint}")
+                next_checkpoint[0] = (epoch // options.checkpoint_epochs + 1) * options.checkpoint_epochs
+
+        # End the warmup once the reputation distribution is stationary and the detailed phase once its statistics converged
+        if simulation["monitors"][phase] is None:
+            if phase == 0 and options.warmup_stationarity is not None:
+                simulation["monitors"][phase] = StationarityMonitor(phase_epoch, options.batch_epochs, options.min_batches, options.warmup_stationarity, options.collateral_locked)
+            elif phase == 1 and options.target_precision is not None:
+                simulation["monitors"][phase] = ConvergenceMonitor(phase_epoch, options.batch_epochs, options.min_batches, options.target_precision)
+        monitor = None
+        if simulation["monitors"][phase] is not None:
+            def monitor(epoch, epoch_data_requests, total_data_requests, phase=phase):
+                if not simulation["monitors"][phase].update(ars, epoch, total_data_requests):
+                    return False
+                # Streamed data requests of the epoch the phase ended at are simulated by the next phase
+                if isinstance(data_requests, DataRequestsStream):
+                    data_requests.unread(epoch, epoch_data_requests)
+                return True
+
+        if telemetry is not None:
+            telemetry.phase = phase
+
+        if profiler is not None:
+            profiler.enter(mode)
+
+        if data_requests is None:
+            events = generate_data_request_events(options, first_epoch, last_epoch, workload_seed)
         else:
-            if epoch in data_requests_per_epoch:
-                if len(data_requests_per_epoch[epoch]) not in detailed_data_request_hist:
-                    detailed_data_request_hist[len(data_requests_per_epoch[epoch])] = 1
-                else:
-                    detailed_data_request_hist[len(data_requests_per_epoch[epoch])] += 1
-                total_detailed_data_requests += len(data_requests_per_epoch[epoch])
-
-                leftover_reputation = simulate_block(
-                    logger,
-                    "Detailed",
-                    ars,
-                    epoch,
-                    data_requests_per_epoch[epoch],
-                    options.approximate_eligibility,
-                    leftover_reputation,
-                )
-            else:
-                if 0 not in detailed_data_request_hist:
-                    detailed_data_request_hist[0] = 1
-                else:
-                    detailed_data_request_hist[0] += 1
-                logger.info(f"Detailed, epoch {epoch}, 0 data requests")
-
-    if options.detailed_epochs > 0:
-        # assert that the reputation statistics make sense
-        for identity in ars.identities.values():
-            assert identity.total_reputation == sum(reputation[1] for reputation in identity.reputation_gains)
-
-        if options.print_ars:
-            ars.print_ARS()
-
-    if options.warmup_epochs > 0:
-        f_stats.write(f"Data requests simulated in warmup: {total_warmup_data_requests}\n")
-        for num, counter in sorted(warmup_data_request_hist.items()):
-            f_stats.write(f"Blocks with {num} data requests: {counter} ({counter / options.warmup_epochs * 100:.2f}%)\n")
-        f_stats.write(f"{total_warmup_data_requests / options.warmup_epochs:.2f} data requests / epoch\n\n")
-    if options.detailed_epochs > 0:
-        f_stats.write(f"Data requests simulated in detailed: {total_detailed_data_requests}\n")
-        for num, counter in sorted(detailed_data_request_hist.items()):
-            f_stats.write(f"Blocks with {num} data requests: {counter} ({counter / options.detailed_epochs * 100:.2f}%)\n")
-        f_stats.write(f"{total_detailed_data_requests / options.detailed_epochs:.2f} data requests / epoch\n\n")
-
-    ars.collect_stats(f_stats)
-
-    f_stats.write(f"The simulation took {time.perf_counter() - start:.2f} seconds\n")
+            events = data_requests.events(first_epoch, last_epoch)
+        data_request_hist, total_data_requests, leftover_reputation, end_epoch = simulate_phase(
+            logger,
+            mode,
+            ars,
+            events,
+            phase_epoch,
+            last_epoch,
+            options,
+            simulation["leftover_reputation"],
+            data_request_hist=simulation["data_request_hists"][phase],
+            total_data_requests=simulation["total_data_requests"][phase],
+            checkpoint=checkpoint,
+            monitor=monitor,
+            telemetry=telemetry,
+        )
+        if profiler is not None:
+            profiler.exit()
+        simulation["data_request_hists"][phase] = data_request_hist
+        simulation["total_data_requests"][phase] = total_data_requests
+        simulation["epochs"][phase] = end_epoch - phase_epoch
+        # The detailed phase does not carry over reputation left over from the warmup
+        simulation["leftover_reputation"] = 0
+
+        if end_epoch < last_epoch:
+            logger.info(f"{mode}, converged after {end_epoch - phase_epoch} of {last_epoch - phase_epoch} epochs")
+
+        if end_epoch > phase_epoch:
+            # assert that the reputation statistics make sense
+            counts, witnessing_acts, reputation_gains = ars.state.reputation_gains.arrays()
+            assert (numpy.bincount(numpy.repeat(numpy.arange(len(counts)), counts), weights=reputation_gains, minlength=len(counts)) == ars.state.total_reputation).all()
+
+            if options.print_ars:
+                ars.print_ARS()
+
+        if phase == 0 and warmup_checkpoint:
+            simulation["phase"], simulation["epoch"] = 1, end_epoch
+            save_checkpoint(warmup_checkpoint, ars, simulation)
+            logger.info(f"Saved warmup checkpoint to {warmup_checkpoint}")
+
+    if telemetry is not None:
+        telemetry.close()
+
+    # Streamed data requests are only known to be too few once the input files are exhausted
+    if options.stream_data_requests and data_requests is not None and data_requests.exhausted:
+        logger.warning(f"Too few epochs {data_requests.last_epoch} read from input files to complete simulation")
+
+    # The run completed, so its mid-run checkpoint is no longer needed
+    if run_checkpoint and os.path.exists(run_checkpoint):
+        os.remove(run_checkpoint)
+
+    return SimulationResult(options, ars, simulation["data_request_hists"], simulation["total_data_requests"], simulation["epochs"], time.perf_counter() - start)
+
+# Statistics of independent replicas of one simulation, as the mean and the half-width of their 95% confidence interval
+class ReplicaResults:
+    def __init__(self, replica_stats, seconds):
+        self.replica_stats = replica_stats
+        self.seconds = seconds
+
+        self.stats, self.intervals = {}, {}
+        for name in replica_stats[0]:
+            self.stats[name], self.intervals[name] = confidence_interval([stats[name] for stats in replica_stats])
+        self.stats["percentiles"] = replica_stats[0]["percentiles"]
+
+def run_replica(options):
+    result = run_simulation(options)
+    stop_loggers()
+    return result.stats
+
+# Simulate independent replicas of the same configuration in parallel, each with its own streams spawned from the seed
+def run_replicas(options):
+    start = time.perf_counter()
+
+    replica_options = []
+    for replica in range(options.replicas):
+        replica_options.append(copy.copy(options))
+        replica_options[-1].replica = replica
+        replica_options[-1].log_path = f"{options.log_path}.{replica}"
+        if options.telemetry_file:
+            replica_options[-1].telemetry_file = f"{options.telemetry_file}.{replica}"
+        if options.profile_folded:
+            replica_options[-1].profile_folded = f"{options.profile_folded}.{replica}"
+
+    # Every replica has an ARS of its own, so only the ARS file is shared
+    with share_inputs(replica_options if options.shared_inputs else []) as shared:
+        with multiprocessing.Pool(min(options.replicas, os.cpu_count()), maxtasksperchild=1, initializer=attach, initargs=(shared.inputs,)) as pool:
+            replica_stats = pool.map(run_replica, replica_options)
+
+    return ReplicaResults(replica_stats, time.perf_counter() - start)
+
+def write_replica_stats(f_stats, options, result):
+    f_stats.write(f"Mean and 95% confidence interval over {options.replicas} replicas\n\n")
+    for mode in ("warmup", "detailed"):
+        if result.stats[mode + "_epochs"] > 0:
+            if any(stats[mode + "_epochs"] != result.stats[mode + "_epochs"] for stats in result.replica_stats):
+                f_stats.write(f"Epochs simulated in {mode}: {result.stats[mode + '_epochs']:.2f} ± {result.intervals[mode + '_epochs']:.2f}\n")
+            f_stats.write(f"Data requests simulated in {mode}: {result.stats[mode + '_data_requests']:.2f} ± {result.intervals[mode + '_data_requests']:.2f}\n")
+            f_stats.write(f"{result.stats[mode + '_data_requests'] / result.stats[mode + '_epochs']:.2f} data requests / epoch\n\n")
+
+    write_stats(f_stats, result.stats, result.intervals)
+
+def write_data_request_hist(f_stats, mode, data_request_hist, total_data_requests, epochs, max_epochs):
+    if epochs < max_epochs:
+        f_stats.write(f"Epochs simulated in {mode}: {epochs} of {max_epochs}\n")
+    f_stats.write(f"Data requests simulated in {mode}: {total_data_requests}\n")
+    for num in numpy.flatnonzero(data_request_hist).tolist():
+        f_stats.write(f"Blocks with {num} data requests: {data_request_hist[num]} ({data_request_hist[num] / epochs * 100:.2f}%)\n")
+    f_stats.write(f"{total_data_requests / epochs:.2f} data requests / epoch\n\n")
+
+def main(argv=None):
+    options, args = create_parser().parse_args(argv)
+
+    # Only reproducible simulations are looked up in and stored to the result cache
+    result_cache = ResultCache(options.result_cache) if options.use_result_cache and cacheable(options) else None
+
+    # Replicas are only reproducible from a known seed, so draw one if none was given
+    if options.replicas > 1 and options.seed is None:
+        options.seed = numpy.random.SeedSequence().entropy
+
+    f_stats = open_stats_file(options.stats_file)
+
+    dump_options(options, f_stats)
+
+    if result_cache is not None and not options.force:
+        result = result_cache.lookup(options)
+        if result is not None:
+            f_stats.write(result.text)
+            f_stats.write(f"Read from the result cache, simulated at {result.created} (key {result.key})\n")
+            f_stats.close()
+            result_cache.close()
+            return result
+
+    # Statistics are written to the file once complete, so the result cache stores the same text
+    f_results = io.StringIO()
+
+    if options.replicas > 1 and options.replica is None:
+        result = run_replicas(options)
+        write_replica_stats(f_results, options, result)
+        f_results.write(f"The simulation took {result.seconds:.2f} seconds\n")
+    else:
+        result = run_simulation(options)
+
+        if result.warmup_epochs > 0:
+            write_data_request_hist(f_results, "warmup", result.warmup_data_request_hist, result.total_warmup_data_requests, result.warmup_epochs, options.warmup_epochs)
+        if result.detailed_epochs > 0:
+            write_data_request_hist(f_results, "detailed", result.detailed_data_request_hist, result.total_detailed_data_requests, result.detailed_epochs, options.detailed_epochs)
+
+        result.ars.collect_stats(f_results, result.stats)
+
+        if result.profile is not None:
+            result.profile.write_profile(f_results)
 
+        f_results.write(f"The simulation took {result.seconds:.2f} seconds\n")
+
+        stop_loggers()
+
+    f_stats.write(f_results.getvalue())
     f_stats.close()
 
+    if result_cache is not None:
+        result_cache.store(options, result.stats, f_results.getvalue(), getattr(result, "intervals", None))
+        result_cache.close()
+
+    return result
+
 if __name__ == "__main__":
     main()
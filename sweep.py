@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing
+import optparse
+import os
+import shlex
+import time
+
+import simulator
+from data_requests import read_data_requests_files
+from result_cache import STATS_COLUMNS
+from shared_inputs import attach
+
+def parse_list(value, cast):
+    return [cast(item) for item in value.split(",")] if value else []
+
+# Build the grid of runs as (name, configuration, simulator arguments)
+def build_runs(options):
+    # Every data requests file list is one workload, every average number of data requests is one synthetic workload
+    workloads = [("data_requests_file", files) for files in options.data_requests_files]
+    workloads += [("avg_data_requests", avg_data_requests) for avg_data_requests in parse_list(options.avg_data_requests, int)]
+    if len(workloads) == 0:
+        workloads = [(None, None)]
+
+    runs = []
+    grid = itertools.product(
+        parse_list(options.balances, int),
+        parse_list(options.collateral_locked, int),
+        workloads,
+        parse_list(options.seeds, int) or [None],
+    )
+    for balance, collateral_locked, (workload, workload_value), seed in grid:
+        argv = ["--log-stdout", "critical"] + shlex.split(options.simulator_options)
+        argv += ["--balance", str(balance), "--collateral-locked", str(collateral_locked)]
+        configuration = {"balance": balance, "collateral_locked": collateral_locked}
+        if workload is not None:
+            argv += ["--" + workload.replace("_", "-"), str(workload_value)]
+            configuration[workload] = workload_value
+        if seed is not None:
+            argv += ["--seed", str(seed)]
+            configuration["seed"] = seed
+
+        # The name of a run is derived from its arguments, so an identical configuration maps to the same results
+        name = hashlib.sha256(" ".join(argv).encode("utf-8")).hexdigest()[:16]
+        runs.append((name, configuration, argv))
+
+    return runs
+
+# Runs which do not have results in the results directory yet
+def pending_runs(runs, results_dir):
+    return [run for run in runs if not os.path.exists(os.path.join(results_dir, run[0] + ".json"))]
+
+def run_simulation(results_dir, name, configuration, argv):
+    prefix = os.path.join(results_dir, name)
+    result = simulator.main(argv + ["--stats-file", prefix + ".stats", "--log-path", prefix + ".log"])
+    stats = {column: result.stats[column] for column in STATS_COLUMNS}
+
+    # The results file is written last and atomically, so it only exists for completed runs
+    with open(prefix + ".json.tmp", "w") as f:
+        json.dump({"configuration": configuration, "argv": argv, "stats": stats}, f)
+    os.replace(prefix + ".json.tmp", prefix + ".json")
+
+    return name
+
+def run_simulation_task(task):
+    return run_simulation(*task)
+
+# Consolidate the results of all runs in the results directory, including those of earlier sweeps
+def write_results_table(results_dir):
+    configuration_columns = []
+    rows = []
+    for filename in sorted(os.listdir(results_dir)):
+        if not filename.endswith(".json"):
+            continue
+        with open(os.path.join(results_dir, filename)) as f:
+            results = json.load(f)
+        for column in results["configuration"]:
+            if column not in configuration_columns:
+                configuration_columns.append(column)
+        rows.append(dict(name=filename[:-len(".json")], **results["configuration"], **results["stats"]))
+
+    with open(os.path.join(results_dir, "sweep.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["name"] + configuration_columns + STATS_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def main():
+    start = time.perf_counter()
+
+    parser = optparse.OptionParser()
+
+    # Parameter grid, every combination is simulated
+    parser.add_option("--balances", type="string", dest="balances", default="100", help="Comma-separated balances of each ARS identity in WIT")
+    parser.add_option("--collateral-locked", type="string", dest="collateral_locked", default="1000", help="Comma-separated times in epochs collateral will be locked after being used")
+    parser.add_option("--avg-data-requests", type="string", dest="avg_data_requests", help="Comma-separated average numbers of data requests in a block of a synthetic workload")
+    parser.add_option("--data-requests-files", type="string", action="append", dest="data_requests_files", default=[], help="Data requests files of one workload, can be repeated")
+    parser.add_option("--seeds", type="string", dest="seeds", help="Comma-separated seeds to simulate every configuration with")
+
+    # Options shared by all runs
+    parser.add_option("--simulator-options", type="string", dest="simulator_options", default="", help="Additional options passed to every simulation")
+
+    # Sweep options
+    parser.add_option("--results-dir", type="string", dest="results_dir", default=os.path.join("results", "sweep"), help="Directory for the statistics, logs and results of all runs")
+    parser.add_option("--processes", type="int", dest="processes", default=os.cpu_count(), help="Number of simulations to run in parallel")
+    parser.add_option("--shared-inputs", action="store_true", dest="shared_inputs", default=False, help="Read the ARS files and create the initial ARS shared by seeded runs once, and share them with the workers")
+
+    options, args = parser.parse_args()
+
+    if not os.path.exists(options.results_dir):
+        os.makedirs(options.results_dir)
+
+    runs = build_runs(options)
+    pending = pending_runs(runs, options.results_dir)
+    print(f"Simulating {len(pending)} of {len(runs)} configurations, {len(runs) - len(pending)} already have results")
+
+    # Convert the data requests files once up front instead of in every worker, the workers then share the memory-mapped cache
+    for data_requests_files in options.data_requests_files:
+        read_data_requests_files(data_requests_files)
+
+    # The workers attach to the shared inputs read-only and only copy the state they modify
+    pending_options = [simulator.create_parser().parse_args(argv)[0] for name, configuration, argv in pending] if options.shared_inputs else []
+    with simulator.share_inputs(pending_options) as shared:
+        # Every run gets a fresh process, so loggers and module state never leak from one simulation into the next
+        with multiprocessing.Pool(options.processes, maxtasksperchild=1, initializer=attach, initargs=(shared.inputs,)) as pool:
+            tasks = [(options.results_dir, name, configuration, argv) for name, configuration, argv in pending]
+            for finished, name in enumerate(pool.imap_unordered(run_simulation_task, tasks)):
+                print(f"Finished {finished + 1} / {len(pending)}: {name}")
+
+    write_results_table(options.results_dir)
+
+    print(f"The sweep took {time.perf_counter() - start:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import io
+import numpy
+import os
+import zipfile
+
+# Columns recorded per simulated block and their types on disk
+COLUMNS = [
+    ("phase", numpy.int8),
+    ("epoch", numpy.int64),
+    ("data_requests", numpy.int32),
+    ("solved", numpy.int32),
+    ("unsolved", numpy.int32),
+    ("commit_rounds", numpy.int32),
+    ("eligible", numpy.int32),
+    ("insufficient_collateral", numpy.int32),
+    ("created_reputation", numpy.int64),
+    ("expired_reputation", numpy.int64),
+    ("leftover_reputation", numpy.int64),
+    ("active_identities", numpy.int32),
+]
+
+# Per block counters of a simulation, epochs without data requests are not recorded
+# Rows are buffered in a preallocated array and appended as one compressed .npy file per column to a zip archive once
+# the buffer is full, so the telemetry of a simulation never has to fit in memory
+class Telemetry:
+    def __init__(self, path, chunk_rows=4096, chunks=0):
+        self.path = path
+        self.buffer = numpy.zeros((chunk_rows, len(COLUMNS)), dtype=numpy.int64)
+        self.rows = 0
+
+        # Phase of the blocks recorded next
+        self.phase = 0
+
+        # A resumed simulation drops the chunks written after its checkpoint, otherwise the archive is started anew
+        self.chunks = chunks
+        if chunks > 0 and os.path.exists(path):
+            self.truncate(chunks)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    # The ARS counters are cumulative, a block is recorded as the difference of the counters before and after it
+    def record(self, epoch, data_requests, counters_before, counters_after, created_reputation, expired_reputation, leftover_reputation, active_identities):
+        unsolved, commit_rounds, eligible, insufficient_collateral = [after - before for before, after in zip(counters_before, counters_after)]
+        self.buffer[self.rows] = (
+            self.phase,
+            epoch,
+            data_requests,
+            data_requests - unsolved,
+            unsolved,
+            commit_rounds,
+            eligible,
+            insufficient_collateral,
+            created_reputation,
+            expired_reputation,
+            leftover_reputation,
+            active_identities,
+        )
+        self.rows += 1
+        if self.rows == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        if self.rows == 0:
+            return
+        with zipfile.ZipFile(self.path, "a", compression=zipfile.ZIP_DEFLATED) as archive:
+            for column, (name, dtype) in enumerate(COLUMNS):
+                with archive.open(f"{name}/{self.chunks:06d}.npy", "w") as f:
+                    numpy.save(f, self.buffer[:self.rows, column].astype(dtype))
+        self.chunks += 1
+        self.rows = 0
+
+    def close(self):
+        self.flush()
+
+    def truncate(self, chunks):
+        with zipfile.ZipFile(self.path) as archive:
+            members = archive.infolist()
+            if all(int(os.path.splitext(os.path.basename(member.filename))[0]) < chunks for member in members):
+                return
+            with zipfile.ZipFile(self.path + ".tmp", "w", compression=zipfile.ZIP_DEFLATED) as truncated:
+                for member in members:
+                    if int(os.path.splitext(os.path.basename(member.filename))[0]) < chunks:
+                        truncated.writestr(member, archive.read(member))
+        os.replace(self.path + ".tmp", self.path)
+
+# Read all columns of a telemetry file as arrays with one element per recorded block
+def read_telemetry(path):
+    columns = {name: [] for name, dtype in COLUMNS}
+    with zipfile.ZipFile(path) as archive:
+        for member in sorted(archive.namelist()):
+            columns[os.path.dirname(member)].append(numpy.load(io.BytesIO(archive.read(member))))
+    return {name: numpy.concatenate(columns[name]) if columns[name] else numpy.zeros(0, dtype=dtype) for name, dtype in COLUMNS}
@@ -1,10 +1,48 @@
 #!/usr/bin/python3
 
+import json
+import numpy
+import optparse
+import os
+import random
+import sqlite3
+import tempfile
+
 from ARS import ARS
+from ars_state import ItemQueues
+from benchmark import compare
+from confidence import confidence_interval
+from data_requests import DataRequestsStream
+from data_requests import parse_data_requests_files
+from estimator import erlang_b
+from estimator import estimate_statistics
+from estimator import selection_probability
+from estimator import synthetic_rate
+from logger import create_logger
+from result_cache import CachedResult
+from shared_inputs import attach
+from shared_inputs import attached
+from shared_inputs import detach
+from simulator import create_ARS
+from simulator import generate_data_request_events
+from simulator import main as simulator_main
+from simulator import run_simulation
+from simulator import seed_sequences
+from simulator import share_inputs
+from simulator import simulate_phase
+from simulator import simulation_options
+from sweep import build_runs
+from sweep import pending_runs
+from sweep import write_results_table
+from telemetry import Telemetry
+from telemetry import read_telemetry
+
+# Tests log to a temporary directory instead of simulation.log in the working directory
+LOG_PATH = os.path.join(tempfile.mkdtemp(), "simulation.log")
 
 def test_simple_eligibility():
-    ars = ARS()
-    ars.initialize_random_ARS(size=7)
+    ars = ARS("critical", "critical", 1000, LOG_PATH)
+    ars.initialize_zero_reputation_ARS(7, 100)
     ars.set_reputations([79, 9, 1, 1, 1, 1, 0])
     eligibilities, total_rep = ars.trapezoidal_eligibility()
 
@@ -23,8 +61,8 @@ def test_complex_eligibility():
     reputation = [identity[0] for identity in live_ARS]
     eligibility = [identity[1] for identity in live_ARS]
 
-    ars = ARS()
-    ars.initialize_random_ARS(size=len(reputation))
+    ars = ARS("critical", "critical", 1000, LOG_PATH)
+    ars.initialize_zero_reputation_ARS(len(reputation), 100)
     ars.set_reputations(reputation)
 
     eligibilities, total_rep = ars.trapezoidal_eligibility()
@@ -32,9 +70,473 @@ def test_complex_eligibility():
     for eligibility, ars_id in zip(eligibilities.values(), live_ARS):
         assert ars_id[1] == round((eligibility + 1) / (total_rep + len(reputation)) * 100, 6)
 
+def test_exact_eligibility_distribution():
+    ars = ARS("critical", "critical", 1000, LOG_PATH)
+    ars.rng = numpy.random.default_rng(1)
+    random.seed(1)
+
+    eligibilities = numpy.array([0.0001, 0.001, 0.01, 0.05])
+    trials = 10000
+    for num_witnesses, commit_round in ((1, 0), (10, 0), (10, 3)):
+        draws = num_witnesses * (2 ** commit_round)
+
+        # Eligibility as drawn by the original loop of `draws` uniform values per identity
+        loop_eligible = numpy.zeros(len(eligibilities))
+        for trial in range(trials):
+            for i, eligibility in enumerate(eligibilities):
+                loop_eligible[i] += min([random.random() for nw in range(draws)]) < eligibility
+
+        # Eligibility as drawn with one uniform value per identity
+        probabilities = ars.eligibility_probabilities(eligibilities, False, num_witnesses, commit_round)
+        vector_eligible = (ars.rng.random((trials, len(eligibilities))) < probabilities).sum(axis=0)
+
+        # Both frequencies should be within five standard deviations of each other
+        expected = 1 - (1 - eligibilities) ** draws
+        assert numpy.allclose(probabilities, expected)
+        tolerance = 5 * numpy.sqrt(2 * expected * (1 - expected) / trials) + 1 / trials
+        assert numpy.all(numpy.abs(loop_eligible - vector_eligible) / trials <= tolerance), (loop_eligible, vector_eligible)
+
+def test_incremental_eligibility():
+    ars = ARS("critical", "critical", 1000, LOG_PATH)
+    ars.initialize_zero_reputation_ARS(200, 100)
+
+    rng = numpy.random.default_rng(1)
+    ars.set_reputations(rng.integers(0, 1000, 200) * (rng.random(200) < 0.7))
+    for block in range(50):
+        # Change the reputation of a few identities as witnessing and expiring would
+        identities = list(ars.identities.values())
+        for index in rng.choice(200, rng.integers(0, 10), replace=False):
+            identities[index].total_reputation = max(0, identities[index].total_reputation + int(rng.integers(-50, 50)))
+        eligibilities = ars.calculate_eligibilities().by_identity()
+
+        # Compare against eligibilities calculated from scratch
+        ars.state.invalidate_ranking()
+        expected = ars.calculate_eligibilities().by_identity()
+        assert numpy.array_equal(eligibilities, expected), block
+
+    # Without any reputation changes, the eligibilities of the last block are reused
+    assert ars.calculate_eligibilities() is ars.calculate_eligibilities()
+
+def test_eligibility_ranking_reuse():
+    ars = ARS("critical", "critical", 1000, LOG_PATH)
+    ars.initialize_zero_reputation_ARS(10, 100)
+    ars.set_reputations(numpy.array([5, 3, 1, 0, 0, 0, 0, 0, 0, 0]))
+    eligibilities = ars.calculate_eligibilities()
+    assert eligibilities.identities().tolist()[:3] == [0, 1, 2]
+
+    # Swapping two reputations keeps the trapezoid parameters, so the eligibilities are reused for the new ranking
+    identities = list(ars.identities.values())
+    identities[0].total_reputation, identities[1].total_reputation = 3, 5
+    reused = ars.calculate_eligibilities()
+    assert reused is eligibilities
+    assert reused.identities().tolist() == [index for _, index in ars.state.ranking]
+    assert reused.identities().tolist()[:3] == [1, 0, 2]
+    by_identity = reused.by_identity()
+    ars.state.invalidate_ranking()
+    assert numpy.array_equal(by_identity, ars.calculate_eligibilities().by_identity())
+
+def test_collateral_unlocks():
+    ars = ARS("critical", "critical", 5, LOG_PATH)
+    ars.initialize_zero_reputation_ARS(1, 10)
+    identity = list(ars.identities.values())[0]
+
+    ars.state.unlock_collateral(0)
+    for epoch in (0, 0):
+        assert identity.can_witness(epoch, 4)
+        identity.mark_collateral(epoch, 4, epoch + ars.collateral_locked)
+    assert not identity.can_witness(1, 4)
+    assert identity.available_collateral == [(0, 2), (5, 4), (5, 4)]
+
+    # Collateral only becomes available again once the epoch it was locked until is reached
+    ars.state.unlock_collateral(4)
+    assert not identity.can_witness(4, 4)
+    ars.state.unlock_collateral(5)
+    assert identity.can_witness(5, 4)
+    assert identity.collaterizable_balance == 10
+
+    assert identity.solved_data_requests == 2
+    assert identity.eligible_no_collateral == 2
+
+def test_sparse_eligibility_distribution():
+    ars = ARS("critical", "critical", 1000, LOG_PATH)
+    ars.initialize_zero_reputation_ARS(300, 100)
+    rng = numpy.random.default_rng(2)
+    ars.set_reputations(rng.integers(0, 500, 300) * (rng.random(300) < 0.6))
+    ars.rng = numpy.random.default_rng(3)
+
+    eligibilities = ars.calculate_eligibilities()
+    trials = 4000
+    for approximate_eligibility in (False, True):
+        for commit_round in (0, 3):
+            expected = numpy.minimum(ars.eligibility_probabilities(eligibilities.probabilities, approximate_eligibility, 10, commit_round), 1)
+
+            # Eligibility frequency per rank and number of eligible identities for the sparse and the dense draws
+            sparse_eligible, dense_eligible = numpy.zeros(300), numpy.zeros(300)
+            sparse_counts, dense_counts = [], []
+            for trial in range(trials):
+                sparse_ranks = ars.draw_eligible_ranks_sparse(eligibilities, approximate_eligibility, 10, commit_round)
+                assert len(set(sparse_ranks)) == len(sparse_ranks)
+                sparse_eligible[sparse_ranks] += 1
+                sparse_counts.append(len(sparse_ranks))
+
+                dense_ranks = ars.draw_eligible_ranks_dense(eligibilities, approximate_eligibility, 10, commit_round)
+                dense_eligible[dense_ranks] += 1
+                dense_counts.append(len(dense_ranks))
+
+            tolerance = 5 * numpy.sqrt(expected * (1 - expected) / trials) + 1 / trials
+            assert numpy.all(numpy.abs(sparse_eligible / trials - expected) <= tolerance)
+            assert numpy.all(numpy.abs(dense_eligible / trials - expected) <= tolerance)
+
+            count_tolerance = 5 * numpy.sqrt((numpy.var(sparse_counts) + numpy.var(dense_counts)) / trials) + 1 / trials
+            assert abs(numpy.mean(sparse_counts) - numpy.mean(dense_counts)) <= count_tolerance
+            assert abs(numpy.var(sparse_counts) - numpy.var(dense_counts)) <= 0.2 * numpy.var(dense_counts) + 1 / trials
+
+def test_batch_collateral_order():
+    ars = ARS("critical", "critical", 1000, LOG_PATH)
+    ars.initialize_zero_reputation_ARS(20, 5)
+    eligibilities = ars.calculate_eligibilities()
+
+    # Every identity can collateralize one data request, so later data requests have to use the remaining identities
+    results = ars.select_witnesses_batch(eligibilities, True, [(10, 5), (10, 5), (10, 5)], 0)
+    assert results[0][0] and results[1][0] and not results[2][0]
+    assert len(set(results[0][1]) | set(results[1][1])) == 20
+    assert len(results[2][1]) == 0 and len(results[2][2]) == 20
+
+def test_snapshot_restore():
+    ars = ARS("critical", "critical", 10, LOG_PATH)
+    ars.initialize_zero_reputation_ARS(50, 10)
+    for epoch in range(0, 60, 3):
+        eligibilities = ars.calculate_eligibilities()
+        success, witnesses, _ = ars.select_witnesses(eligibilities, False, 5, epoch, 2)
+        if success:
+            ars.update_ARS_reputation(witnesses, ars.get_ARS_created_reputation(len(witnesses), epoch) + ars.get_ARS_expired_reputation(len(witnesses), epoch), epoch)
+
+    snapshot = ars.snapshot()
+    restored = ARS("critical", "critical", 10, LOG_PATH)
+    restored.restore(snapshot)
+    for name, identity in ars.identities.items():
+        assert restored.identities[name].total_reputation == identity.total_reputation
+        assert list(restored.identities[name].reputation_gains) == list(identity.reputation_gains)
+        assert restored.identities[name].available_collateral == identity.available_collateral
+
+    # Restoring includes the random number generators, so a restored ARS selects the same witnesses as the original one
+    witnesses = ars.select_witnesses(ars.calculate_eligibilities(), False, 5, 60, 2)
+    assert restored.select_witnesses(restored.calculate_eligibilities(), False, 5, 60, 2) == witnesses
+
+def test_data_requests_columns():
+    filenames = []
+    for lines in ("100,0xaa,10,5000000000\n100,0xbb,20,2500000000\n", "103,0xcc,5,1000000000\n107,0xdd,5,1000000000\n"):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write(lines)
+        filenames.append(f.name)
+    data_requests_files = ",".join(filenames)
+
+    # Epochs are normalized to the first data request and epochs without data requests are skipped
+    data_requests = parse_data_requests_files(data_requests_files)
+    assert list(data_requests.events(0, 10)) == [(0, [(10, 5.0), (20, 2.5)]), (3, [(5, 1.0)]), (7, [(5, 1.0)])]
+    assert list(data_requests.events(1, 3)) == []
+    assert data_requests.max_epoch() == 7
+
+    # Streamed data requests read past the end of one window are kept for the next one
+    data_requests = DataRequestsStream(data_requests_files)
+    assert list(data_requests.events(1, 3)) == []
+    assert list(data_requests.events(3, 10)) == [(3, [(5, 1.0)]), (7, [(5, 1.0)])]
+    assert data_requests.exhausted and data_requests.last_epoch == 7
+
+    # An epoch handed back by a phase that ended early is yielded again by the next window
+    data_requests = DataRequestsStream(data_requests_files)
+    events = data_requests.events(0, 10)
+    assert next(events) == (0, [(10, 5.0), (20, 2.5)])
+    epoch, epoch_data_requests = next(events)
+    data_requests.unread(epoch, epoch_data_requests)
+    assert list(data_requests.events(epoch, 10)) == [(3, [(5, 1.0)]), (7, [(5, 1.0)])]
+
+    for filename in filenames:
+        os.remove(filename)
+
+def test_logger_handlers():
+    for i in range(3):
+        ars = ARS("critical", "critical", 10, LOG_PATH)
+    assert len(ars.logger.handlers) == 1
+    assert len(ars.identity_logger.handlers) == 1
+
+def test_run_simulation():
+    options = simulation_options(identities=100, collateral_locked=50, detailed_epochs=200, seed=1, log_stdout="critical", log_file="critical", log_path=LOG_PATH)
+    result = run_simulation(options)
+    assert result.detailed_data_request_hist.sum() == 200
+    assert result.total_detailed_data_requests == numpy.dot(numpy.arange(len(result.detailed_data_request_hist)), result.detailed_data_request_hist)
+    assert numpy.isclose(result.solved_data_requests.sum(), result.stats["avg_solved"] * numpy.count_nonzero(result.solved_data_requests))
+
+    # Seeded simulations are reproducible
+    assert numpy.array_equal(run_simulation(options).solved_data_requests, result.solved_data_requests)
+
+    # Replicas of the same seed use independent streams
+    replica = run_simulation(simulation_options(**dict(vars(options), replica=1)))
+    assert not numpy.array_equal(replica.solved_data_requests, result.solved_data_requests)
+
+    # A simulation can continue from the snapshot of an earlier one
+    continued = run_simulation(options, snapshot=result.ars.snapshot())
+    assert continued.names == result.names
+
+def test_skip_empty_epochs():
+    options = simulation_options(identities=100, collateral_locked=20, balance=30, avg_data_requests=0.3, std_data_requests=0.5, seed=1, log_stdout="critical", log_file="critical", log_path=LOG_PATH)
+    logger = create_logger("simulator", "critical", "critical", LOG_PATH)
+    events = list(generate_data_request_events(options, 0, 500, numpy.random.SeedSequence(1)))
+    assert 0 < len(events) < 400
+
+    # Stepping through every epoch, including those without data requests, simulates the same as jumping between events
+    data_requests = dict(events)
+    every_epoch = [(epoch, data_requests.get(epoch, [])) for epoch in range(500)]
+    results = []
+    for phase_events in (events, every_epoch):
+        ars = create_ARS(options, seed_sequences(options)[0])
+        results.append((simulate_phase(logger, "Warmup", ars, iter(phase_events), 0, 500, options, 0), ars.state.total_reputation.tolist(), ars.state.solved_data_requests.tolist(), ars.unsolved_data_requests))
+    assert results[0] == results[1]
+    assert results[0][0][0][0] == 500 - len(events)
+
+def test_confidence_interval():
+    mean, interval = confidence_interval([[1, 5], [2, 5], [3, 5]])
+    assert numpy.allclose(mean, [2, 5])
+    assert numpy.allclose(interval, [4.303 / numpy.sqrt(3), 0])
+
+def test_common_random_numbers():
+    # Configurations with different balances and collateral locking see the same eligibility and witness selection
+    witnesses = []
+    for balance, collateral_locked in ((100, 10), (1000, 20)):
+        ars = ARS("critical", "critical", collateral_locked, LOG_PATH, seed=1)
+        ars.initialize_zero_reputation_ARS(100, balance)
+        ars.common_random_numbers = (1, 0)
+        witnesses.append([ars.select_witnesses(ars.calculate_eligibilities(), False, 5, epoch, 1)[1] for epoch in range(5)])
+    assert witnesses[0] == witnesses[1]
+
+def test_convergence():
+    # The detailed phase ends at the first batch boundary where its statistics are precise enough
+    options = simulation_options(identities=100, collateral_locked=50, detailed_epochs=2000, seed=1, target_precision=10.0, batch_epochs=50, min_batches=3, log_stdout="critical", log_file="critical", log_path=LOG_PATH)
+    result = run_simulation(options)
+    assert result.detailed_epochs == 150 and result.detailed_data_request_hist.sum() == 150
+
+    # A precision which is never reached simulates all epochs
+    result = run_simulation(simulation_options(**dict(vars(options), target_precision=0.0, detailed_epochs=200)))
+    assert result.detailed_epochs == 200
+
+    # The warmup ends once the reputation distribution is stationary and the detailed phase starts where it ended
+    result = run_simulation(simulation_options(**dict(vars(options), target_precision=None, warmup_epochs=5000, warmup_stationarity=1.0, detailed_epochs=100)))
+    assert 50 <= result.warmup_epochs < 5000 and result.warmup_data_request_hist.sum() == result.warmup_epochs
+    assert result.detailed_epochs == 100
+
+def test_telemetry():
+    path = os.path.join(tempfile.mkdtemp(), "telemetry.zip")
+
+    # Rows are flushed in chunks and the chunks written after a checkpoint are dropped when resuming
+    telemetry = Telemetry(path, chunk_rows=2)
+    for epoch in range(5):
+        telemetry.record(epoch, 3, (0, 0, 0, 0), (1, 2, 10, 4), 30, 0, 1, 50)
+    telemetry.close()
+    columns = read_telemetry(path)
+    assert columns["epoch"].tolist() == [0, 1, 2, 3, 4] and columns["solved"].tolist() == [2] * 5
+    Telemetry(path, chunk_rows=2, chunks=1).close()
+    assert read_telemetry(path)["epoch"].tolist() == [0, 1]
+
+    # Every simulated block is recorded
+    result = run_simulation(simulation_options(identities=100, collateral_locked=50, warmup_epochs=100, detailed_epochs=200, seed=1, telemetry_file=path, log_stdout="critical", log_file="critical", log_path=LOG_PATH))
+    columns = read_telemetry(path)
+    assert columns["data_requests"].sum() == result.total_warmup_data_requests + result.total_detailed_data_requests
+    assert columns["unsolved"][columns["phase"] == 1].sum() == result.ars.unsolved_data_requests
+    assert (columns["solved"] + columns["unsolved"] == columns["data_requests"]).all()
+    # The active identities are counted after the reputation update of their block, starting from no reputation at all
+    assert (columns["active_identities"][0] > 0) == (columns["solved"][0] > 0)
+    assert columns["active_identities"][-1] == numpy.count_nonzero(result.ars.state.total_reputation[:len(result.ars.state)])
+
+    os.remove(path)
+
+def test_profiler():
+    select_witnesses = ARS.select_witnesses
+    path = os.path.join(tempfile.mkdtemp(), "profile.folded")
+    result = run_simulation(simulation_options(identities=100, collateral_locked=50, warmup_epochs=50, detailed_epochs=100, seed=1, profile=True, profile_folded=path, log_stdout="critical", log_file="critical", log_path=LOG_PATH))
+
+    # Every simulated block is timed within its phase and the timed functions are restored afterwards
+    assert result.profile.calls[("Warmup", "simulate_block")] + result.profile.calls[("Detailed", "simulate_block")] == result.warmup_data_request_hist[1:].sum() + result.detailed_data_request_hist[1:].sum()
+    assert result.profile.total_ns[("Detailed", "select_witnesses")] <= result.profile.total_ns[("Detailed", "simulate_block")]
+    assert ARS.select_witnesses is select_witnesses
+
+    with open(path) as f:
+        stacks = dict(line.rsplit(" ", 1) for line in f)
+    assert "Detailed;simulate_block;select_witnesses" in stacks
+
+    os.remove(path)
+
+def test_benchmark_compare():
+    options = {"identities": 1000}
+    history = [
+        {"scenarios": {"small": {"options": options, "epochs_per_second": 100.0}}},
+        {"scenarios": {"small": {"options": dict(options, identities=2000), "epochs_per_second": 50.0}}},
+    ]
+
+    # Scenarios are compared with the last run with the same options and fail if they slowed down beyond the threshold
+    assert compare(history, {"small": {"options": options, "epochs_per_second": 95.0}}, 0.1) == []
+    assert compare(history, {"small": {"options": options, "epochs_per_second": 85.0}}, 0.1) == ["small"]
+    assert compare(history, {"new": {"options": options, "epochs_per_second": 1.0}}, 0.1) == []
+
+def test_sweep_runs():
+    options = optparse.Values({"balances": "10,20", "collateral_locked": "100", "avg_data_requests": "2,4", "data_requests_files": ["requests.csv"], "seeds": "1,2", "simulator_options": "--identities 50"})
+    runs = build_runs(options)
+    assert len(runs) == 2 * 1 * 3 * 2
+    assert len({name for name, configuration, argv in runs}) == len(runs)
+    name, configuration, argv = runs[0]
+    assert configuration == {"balance": 10, "collateral_locked": 100, "data_requests_file": "requests.csv", "seed": 1}
+    assert argv == ["--log-stdout", "critical", "--identities", "50", "--balance", "10", "--collateral-locked", "100", "--data-requests-file", "requests.csv", "--seed", "1"]
+
+    # Names only depend on the arguments of a run, so the same grid maps to the same results again
+    assert build_runs(options) == runs
+
+def test_sweep_skips_finished_runs():
+    options = optparse.Values({"balances": "10,20", "collateral_locked": "100", "avg_data_requests": "2", "data_requests_files": [], "seeds": None, "simulator_options": ""})
+    runs = build_runs(options)
+    with tempfile.TemporaryDirectory() as results_dir:
+        assert pending_runs(runs, results_dir) == runs
+
+        # Only runs whose results file was written are skipped, leftovers of an interrupted run are simulated again
+        name, configuration, argv = runs[0]
+        with open(os.path.join(results_dir, name + ".json"), "w") as f:
+            json.dump({"configuration": configuration, "argv": argv, "stats": {"avg_solved": 1.5}}, f)
+        with open(os.path.join(results_dir, runs[1][0] + ".json.tmp"), "w") as f:
+            f.write("{")
+        assert pending_runs(runs, results_dir) == runs[1:]
+
+        write_results_table(results_dir)
+        with open(os.path.join(results_dir, "sweep.csv")) as f:
+            lines = f.read().splitlines()
+        assert len(lines) == 2 and lines[1].startswith(f"{name},10,100,2,")
+
+def test_item_queues():
+    queues = ItemQueues(3, "q")
+    queues.extend(numpy.array([2, 0, 1]), numpy.array([1, 4, 2]), numpy.array([10, 40, 20]))
+    queues.append(1, 5, 50)
+    queues.append(0, 6, 60)
+    assert [queues.items(queue) for queue in range(3)] == [[(1, 10), (4, 40), (6, 60)], [(5, 50)], [(2, 20)]]
+
+    # Popped slots are reused by the next items
+    assert queues.popleft(0) == (1, 10) and queues.popleft(2) == (2, 20)
+    queues.append(2, 7, 70)
+    queues.append(2, 8, 80)
+    assert len(queues.times) == 5 and queues.lengths.tolist() == [2, 1, 2]
+
+    counts, times, amounts = queues.arrays()
+    assert counts.tolist() == [2, 1, 2] and times.tolist() == [4, 6, 5, 7, 8] and amounts.tolist() == [40, 60, 50, 70, 80]
+
+def test_estimator():
+    assert erlang_b(0, numpy.array([3.0]))[0] == 1
+    assert numpy.isclose(erlang_b(1, numpy.array([3.0]))[0], 3 / 4)
+    assert numpy.isclose(erlang_b(2, numpy.array([1.0]))[0], 1 / 5)
+    assert synthetic_rate(4, 0) == 4 and abs(synthetic_rate(4, 2) - 4) < 0.05
+    assert numpy.isclose(selection_probability(numpy.array([0.0]), 1)[0], 1)
+
+    # Without contention for collateral no identity starves and only too few eligible identities leave data requests unsolved
+    statistics = [estimate_statistics(simulation_options(identities=200, balance=balance, collateral_locked=100, avg_data_requests=2, detailed_epochs=1000, log_stdout="critical", log_file="critical", log_path=LOG_PATH)) for balance in (10000, 100, 10)]
+    assert statistics[0]["starved_identities"] == 0 and statistics[0]["avg_eligible_no_collateral"] < 1E-6 and statistics[0]["unsolved_rate"] < 1E-3
+    assert numpy.isclose(statistics[0]["avg_solved"] * 200, statistics[0]["data_requests_per_epoch"] * 1000 * 10 * (1 - statistics[0]["unsolved_rate"]), rtol=0.01)
+
+    # Less balance means more identities without collateral and more unsolved data requests
+    assert statistics[0]["starved_identities"] <= statistics[1]["starved_identities"] <= statistics[2]["starved_identities"]
+    assert statistics[0]["unsolved_rate"] <= statistics[1]["unsolved_rate"] < statistics[2]["unsolved_rate"]
+    assert statistics[1]["avg_eligible_no_collateral"] < statistics[2]["avg_eligible_no_collateral"]
+
+def test_result_cache():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        result_cache = os.path.join(tmp_dir, "results.sqlite")
+        argv = ["--identities", "100", "--simulation-epochs", "200", "--seed", "3", "--log-stdout", "critical", "--log-file", "critical", "--log-path", os.path.join(tmp_dir, "simulation.log"), "--stats-file", os.path.join(tmp_dir, "other.stats"), "--result-cache", result_cache]
+        result = simulator_main(argv + ["--stats-file", os.path.join(tmp_dir, "simulated.stats")])
+        assert not isinstance(result, CachedResult)
+
+        # The same configuration is read from the cache with the same statistics file
+        cached = simulator_main(argv + ["--stats-file", os.path.join(tmp_dir, "cached.stats")])
+        assert isinstance(cached, CachedResult)
+        assert cached.stats["avg_solved"] == result.stats["avg_solved"] and numpy.array_equal(cached.stats["solved_percentiles"], result.stats["solved_percentiles"])
+        with open(os.path.join(tmp_dir, "simulated.stats")) as simulated_stats, open(os.path.join(tmp_dir, "cached.stats")) as cached_stats:
+            assert cached_stats.read().startswith(simulated_stats.read())
+
+        # Other options, forced and unseeded simulations are simulated again
+        assert not isinstance(simulator_main(argv + ["--balance", "50"]), CachedResult)
+        assert not isinstance(simulator_main(argv + ["--force"]), CachedResult)
+        assert not isinstance(simulator_main([option for option in argv if option not in ("--seed", "3")]), CachedResult)
+
+        connection = sqlite3.connect(result_cache)
+        rows = connection.execute("SELECT json_extract(options, '$.balance'), avg_solved FROM results ORDER BY 1").fetchall()
+        connection.close()
+        assert rows == [(50, rows[0][1]), (100, result.stats["avg_solved"])]
+
+def test_split_randomly():
+    ars = ARS("critical", "critical", 1000, LOG_PATH, seed=1)
+    totals, counts = numpy.array([0, 7, 100, 5]), numpy.array([1, 3, 10, 5])
+    parts, part_counts = ars.split_randomly(totals, counts, True)
+    assert (parts > 0).all() and (part_counts <= counts).all()
+    assert numpy.bincount(numpy.repeat(numpy.arange(4), part_counts), weights=parts, minlength=4).tolist() == totals.tolist()
+
+    # The reputation gains of every identity sum exactly to its reputation and its UTXOs to its balance
+    ars.initialize_random_ARS(1000, 10000, 50, 100)
+    assert ars.state.total_reputation.sum() == ars.total_reputation
+    for identity in ars.identities.values():
+        assert sum(reputation for witnessing_acts, reputation in identity.reputation_gains) == identity.total_reputation
+        assert list(identity.reputation_gains) == sorted(identity.reputation_gains)
+        assert sum(amount for epoch, amount in identity.available_collateral) == 100
+
+def test_shared_inputs():
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+        f.write("".join(f"wit1{index:038x},{index * 7 % 50}\n" for index in range(200)))
+    try:
+        # Both workloads start from the same initial ARS, the unseeded simulation only shares the ARS file
+        options = [simulation_options(ars_file=f.name, balance=20, collateral_locked=30, seed=2, avg_data_requests=avg_data_requests, log_stdout="critical", log_file="critical", log_path=LOG_PATH) for avg_data_requests in (2, 4)]
+        options.append(simulation_options(ars_file=f.name, balance=20, collateral_locked=30, log_stdout="critical", log_file="critical", log_path=LOG_PATH))
+        with share_inputs(options) as shared:
+            assert len(shared.inputs["ars_files"]) == 1 and len(shared.inputs["ars"]) == 1
+            created = [create_ARS(run_options, seed_sequences(run_options)[0]) for run_options in options[:2]]
+
+            attach(shared.inputs)
+            try:
+                assert all(not array.flags.writeable for array in attached["ars_files"][f.name].values())
+                for run_options, ars in zip(options, created):
+                    restored = create_ARS(run_options, seed_sequences(run_options)[0])
+                    for name, identity in ars.identities.items():
+                        assert restored.identities[name].total_reputation == identity.total_reputation
+                        assert list(restored.identities[name].reputation_gains) == list(identity.reputation_gains)
+                        assert list(restored.identities[name].available_collateral) == list(identity.available_collateral)
+                    witnesses = ars.select_witnesses(ars.calculate_eligibilities(), False, 5, 0, 2)
+                    assert restored.select_witnesses(restored.calculate_eligibilities(), False, 5, 0, 2) == witnesses
+
+                unseeded = create_ARS(options[2])
+                assert unseeded.state.total_reputation[:200].tolist() == [index * 7 % 50 for index in range(200)]
+            finally:
+                detach()
+    finally:
+        os.remove(f.name)
+
 def main():
     test_simple_eligibility()
     test_complex_eligibility()
+    test_exact_eligibility_distribution()
+    test_incremental_eligibility()
+    test_eligibility_ranking_reuse()
+    test_collateral_unlocks()
+    test_sparse_eligibility_distribution()
+    test_batch_collateral_order()
+    test_snapshot_restore()
+    test_data_requests_columns()
+    test_logger_handlers()
+    test_run_simulation()
+    test_skip_empty_epochs()
+    test_confidence_interval()
+    test_common_random_numbers()
+    test_convergence()
+    test_telemetry()
+    test_profiler()
+    test_benchmark_compare()
+    test_sweep_runs()
+    test_sweep_skips_finished_runs()
+    test_item_queues()
+    test_estimator()
+    test_result_cache()
+    test_split_randomly()
+    test_shared_inputs()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file